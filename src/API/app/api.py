@@ -5,13 +5,42 @@ if os.environ["HOME"] == "/home/romain":
     PATH_ENV = "/home/romain/Documents/Formation/mai24_cmlops_film/src/API/.env"
     dotenv.load_dotenv(PATH_ENV)
     is_local = True
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI
-from route.recommandation import reco_router
+from route.recommandation import (reco_router, CANARY_STORE, MODEL_STORE, SHADOW_STORE,
+                                  INFERENCE_POOL, RECOMMENDATION_LOG)
 from route.manage_client import router_client
+from route.health import health_router, warm_up
 from prometheus_fastapi_instrumentator import Instrumentator
 from description import description
+from dead_letter import DEAD_LETTER
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Starts serving at once and loads the model and the movies catalog in
+    the background (see route.health.warm_up): /health/ready answers 503
+    until both are loaded. Runs the recommendation log and dead letter
+    writers and the inference workers while the app is running, queued
+    rows are flushed on shutdown.
+    """
+    DEAD_LETTER.start()
+    RECOMMENDATION_LOG.start()
+    INFERENCE_POOL.start()
+    warming_up = asyncio.create_task(warm_up())
+    yield
+    warming_up.cancel()
+    with suppress(asyncio.CancelledError):
+        await warming_up
+    await RECOMMENDATION_LOG.stop()
+    INFERENCE_POOL.stop()
+    DEAD_LETTER.stop()
+    MODEL_STORE.stop()
+    CANARY_STORE.stop()
+    SHADOW_STORE.stop()
+
 
 app = FastAPI(
     title="Movies Recommendation System API",
@@ -23,11 +52,16 @@ app = FastAPI(
         {
             "name": "Recommendation",
             "description": "Route providing recommendations to users."
+        },
+        {
+            "name": "Health",
+            "description": "Liveness and readiness probes."
         }
-    ], debug=is_local
+    ], debug=is_local, lifespan=lifespan
 )
 
 Instrumentator().instrument(app).expose(app)
 
 app.include_router(router_client)
 app.include_router(reco_router)
+app.include_router(health_router)
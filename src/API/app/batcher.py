@@ -0,0 +1,86 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Hashable, List, Set, Tuple
+
+import numpy as np
+
+from metrics import MODEL_BATCH_SIZE, MODEL_BATCH_WAIT
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-row calls of a vectorized function.
+
+    Each call() queues one row under a key (e.g. the model to query) and
+    waits. The rows of a key are stacked and passed to fn in one call as
+    soon as max_rows rows are waiting or max_wait seconds after the first
+    one, then each caller gets its own row of the result. While fn runs,
+    new rows gather for the next call. Must be used from a single event
+    loop. With max_rows <= 1, fn is called at once for every row.
+
+    Attributes:
+    - fn: Coroutine function of (key, 2-D array of rows) returning one
+      result row per input row.
+    - max_rows: Maximum number of rows of one call of fn.
+    - max_wait: Maximum time a row waits for other rows, in seconds.
+    """
+
+    def __init__(self, fn: Callable[[Hashable, np.ndarray], Awaitable[np.ndarray]],
+                 max_rows: int = 32, max_wait: float = 0.0005) -> None:
+        self.fn = fn
+        self.max_rows = max_rows
+        self.max_wait = max_wait
+        self._pending: Dict[Hashable, List[Tuple[np.ndarray, asyncio.Future, float]]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def call(self, key: Hashable, row: np.ndarray) -> np.ndarray:
+        """
+        Returns fn's result row for row, computed with the other rows of
+        the same key queued meanwhile.
+        """
+        if self.max_rows <= 1:
+            MODEL_BATCH_SIZE.observe(1)
+            return (await self.fn(key, np.atleast_2d(row)))[0]
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(key, [])
+        pending.append((row, future, time.perf_counter()))
+        if len(pending) >= self.max_rows:
+            self.flush(key)
+        elif len(pending) == 1:
+            self._timers[key] = loop.call_later(self.max_wait, self.flush, key)
+        return await future
+
+    def flush(self, key: Hashable) -> None:
+        """
+        Starts the call of fn on the rows waiting under key.
+        """
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        pending = self._pending.pop(key, [])
+        if not pending:
+            return
+        start = time.perf_counter()
+        for _, _, queued_at in pending:
+            MODEL_BATCH_WAIT.observe(start - queued_at)
+        MODEL_BATCH_SIZE.observe(len(pending))
+        task = asyncio.ensure_future(self._run(key, pending))
+        # Referenced until done, the loop only keeps weak references
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key: Hashable,
+                   pending: List[Tuple[np.ndarray, asyncio.Future, float]]) -> None:
+        try:
+            results = await self.fn(key, np.stack([row for row, _, _ in pending]))
+        except Exception as e:
+            for _, future, _ in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), result in zip(pending, results):
+            # Cancelled when the client went away
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,71 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Bounded in-process cache with LRU eviction and a time to live.
+
+    Entries expire ttl seconds after they were set. When the cache is full,
+    the least recently used entry is evicted. Operations are guarded by a
+    lock, so the cache can be shared by the event loop and the threadpool
+    running the sync dependencies.
+
+    Attributes:
+    - maxsize: Maximum number of entries.
+    - ttl: Time to live of an entry, in seconds.
+    """
+
+    def __init__(self, maxsize: int, ttl: float,
+                 timer: Callable[[], float] = time.monotonic) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """
+        Returns the value of a key, or default if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= self._timer():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Sets the value of a key, evicting the least recently used entries
+        if the cache is full.
+        """
+        with self._lock:
+            self._data[key] = (self._timer() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """
+        Removes a key and returns its value (default if it is missing).
+        """
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return default if entry is None else entry[1]
+
+    def clear(self) -> None:
+        """
+        Removes all the entries.
+        """
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,197 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from datamodel import Movie, User
+
+# Genre columns of the users table, in table order. Bit i of a movie
+# genre mask stands for GENRES[i].
+GENRES = [
+    column.name for column in User.__table__.columns
+    if column.name not in ("userId", "count_movies")
+]
+GENRE_POSITION = {genre: i for i, genre in enumerate(GENRES)}
+
+
+def normalize_genre(genre: str) -> str:
+    """
+    Normalizes a raw genre label the same way as the training pipeline.
+
+    Example: "Sci-Fi" -> "Sci_Fi", "(no genres listed)" -> "no_genres_listed".
+    """
+    return genre.replace("(", "").replace(")", "")\
+        .replace(" ", "_").replace("-", "_")
+
+
+class CatalogIndex:
+    """
+    Array-backed index of the movies catalog.
+
+    Attributes:
+    - movie_ids: Sorted int32 array of movie identifiers.
+    - titles: Movie titles, aligned with movie_ids.
+    - genre_masks: uint32 array, bit i is set when the movie has GENRES[i].
+    - base_postings: For each genre, int32 array of the rows whose first
+      listed genre is that genre, in movieId order.
+    - postings: base_postings in recommendation order: by popularity when
+      popularity lists are set (see rank), else in movieId order.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[int, str, Optional[str]]],
+                 popularity: Optional[Dict[str, np.ndarray]] = None) -> None:
+        """
+        Builds the index from (movieId, title, genres) rows, ordered by the
+        popularity lists if given.
+        """
+        rows = sorted(rows, key=lambda row: row[0])
+        self.movie_ids = np.fromiter(
+            (row[0] for row in rows), dtype=np.int32, count=len(rows))
+        self.titles = [row[1] for row in rows]
+        self.genre_masks = np.zeros(len(rows), dtype=np.uint32)
+
+        postings = {genre: [] for genre in GENRES}
+        for i, (_, _, genres) in enumerate(rows):
+            labels = [normalize_genre(g) for g in (genres or "").split("|") if g]
+            for label in labels:
+                if label in GENRE_POSITION:
+                    self.genre_masks[i] |= np.uint32(1 << GENRE_POSITION[label])
+            if labels and labels[0] in postings:
+                postings[labels[0]].append(i)
+        self.base_postings = {
+            genre: np.asarray(positions, dtype=np.int32)
+            for genre, positions in postings.items()
+        }
+        self.rank(popularity)
+
+    def rank(self, popularity: Optional[Dict[str, np.ndarray]]) -> None:
+        """
+        Orders the postings by the popularity lists of the model artifact.
+
+        Movies of a genre missing from its list (added to the catalog after
+        training) come last, in movieId order. The new postings are
+        published in one assignment.
+
+        Arguments:
+        - popularity: Genre -> movie IDs, most popular first, or None to
+          go back to movieId order.
+        """
+        if popularity is None:
+            self.postings = self.base_postings
+            return
+        postings = {}
+        for genre, positions in self.base_postings.items():
+            ids = self.movie_ids[positions]
+            ranked = np.asarray(popularity.get(genre, []), dtype=np.int64)
+            ranked = ranked[np.isin(ranked, ids)]
+            postings[genre] = np.concatenate([
+                np.searchsorted(self.movie_ids, ranked).astype(np.int32),
+                positions[~np.isin(ids, ranked)]
+            ])
+        self.postings = postings
+
+    def __len__(self) -> int:
+        return len(self.movie_ids)
+
+    def __contains__(self, movie_id: int) -> bool:
+        return self.position(movie_id) >= 0
+
+    def position(self, movie_id: int) -> int:
+        """
+        Returns the row of a movie in the index, or -1 if it is unknown.
+        """
+        i = int(np.searchsorted(self.movie_ids, movie_id))
+        if i < len(self.movie_ids) and self.movie_ids[i] == movie_id:
+            return i
+        return -1
+
+    def pick(self, genre: str, seen_movies: Iterable[int], k: int = 1) -> List[dict]:
+        """
+        Picks the first k movies of a genre that are not in seen_movies,
+        most popular first when popularity lists are set.
+
+        Arguments:
+        - genre: Genre column name (see GENRES).
+        - seen_movies: Movie IDs to exclude.
+        - k: Maximum number of movies to return.
+
+        Returns:
+        - A list of {"movieId", "title"} dictionaries, possibly empty.
+        """
+        positions = self.postings.get(genre)
+        if positions is None or len(positions) == 0:
+            return []
+        candidates = self.movie_ids[positions]
+        seen = np.fromiter(seen_movies, dtype=np.int64)
+        unseen = positions[~np.isin(candidates, seen)][:k]
+        return [
+            {"movieId": int(self.movie_ids[i]), "title": self.titles[i]}
+            for i in unseen
+        ]
+
+    def ranked_ids(self, genres: Iterable[str]) -> np.ndarray:
+        """
+        Returns the movie IDs of the postings of genres, in recommendation
+        order, seen movies included (unseen_movies filters them).
+        """
+        postings = [self.postings[g] for g in genres if g in self.postings]
+        if not postings:
+            return np.zeros(0, dtype=np.int32)
+        return self.movie_ids[np.concatenate(postings)]
+
+    def describe(self, movie_ids: Iterable[int]) -> List[dict]:
+        """
+        Returns the {"movieId", "title"} dictionaries of movies, in the
+        given order, unknown IDs being skipped.
+        """
+        movies = []
+        for movie_id in movie_ids:
+            i = self.position(movie_id)
+            if i >= 0:
+                movies.append({"movieId": int(movie_id), "title": self.titles[i]})
+        return movies
+
+
+CATALOG: Optional[CatalogIndex] = None
+# Popularity lists of the serving model, applied to every catalog built
+POPULARITY: Optional[Dict[str, np.ndarray]] = None
+
+
+def set_popularity(popularity: Optional[Dict[str, np.ndarray]]) -> None:
+    """
+    Sets the popularity lists (from a newly loaded model) and re-ranks the
+    catalog index with them.
+    """
+    global POPULARITY
+    POPULARITY = popularity
+    if CATALOG is not None:
+        CATALOG.rank(popularity)
+
+
+async def load_catalog(db: AsyncSession) -> CatalogIndex:
+    """
+    Reads the movies table and (re)builds the in-memory catalog index.
+
+    Arguments:
+    - db: Database session.
+
+    Returns:
+    - The new CatalogIndex, also published as catalog.CATALOG.
+    """
+    global CATALOG
+    result = await db.execute(select(Movie.movieId, Movie.title, Movie.genres))
+    rows = result.all()
+    CATALOG = CatalogIndex(rows, POPULARITY)
+    return CATALOG
+
+
+async def get_catalog(db: AsyncSession) -> CatalogIndex:
+    """
+    Returns the catalog index, loading it on first use if the startup hook
+    could not.
+    """
+    catalog = CATALOG
+    if catalog is None:
+        catalog = await load_catalog(db)
+    return catalog
@@ -1,6 +1,10 @@
 import os
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+from sqlalchemy import Engine, create_engine, event
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from datamodel import Client
 
 # Fetch environment variables for database connection
@@ -12,6 +16,7 @@ db_database = os.environ["DB_NAME"]
 
 # Construct the PostgreSQL database URL
 SQLALCHEMY_DATABASE_URL = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_database}"
+ASYNC_SQLALCHEMY_DATABASE_URL = f"postgresql+asyncpg://{db_user}:{db_password}@{db_host}:{db_port}/{db_database}"
 
 # Create the engine with a connection pool
 engine = create_engine(
@@ -23,6 +28,65 @@ engine = create_engine(
 # Create a session factory with custom settings
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Same pool settings for the asyncio engine used by the async route handlers
+async_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL,
+    pool_size=20,
+    max_overflow=10,
+)
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False)
+
+# Statements sent by the current task, while count_queries() is active
+QUERY_COUNT: ContextVar[Optional[List[str]]] = ContextVar("QUERY_COUNT", default=None)
+# Active count_queries() blocks of each engine, count_query listens to
+# an engine only while it has some
+_COUNTING: Dict[Engine, int] = {}
+
+
+def count_query(conn, cursor, statement, parameters, context, executemany) -> None:
+    """
+    before_cursor_execute listener recording each statement sent to the
+    database, if count_queries() is active.
+    """
+    statements = QUERY_COUNT.get()
+    if statements is not None:
+        statements.append(statement)
+
+
+@contextmanager
+def count_queries(*engines: Engine) -> Iterator[List[str]]:
+    """
+    Records the statements sent to the database in the block, for tests
+    and benchmarks asserting the number of round trips of a request.
+
+    The count_query listener is attached to the engines for the duration
+    of the block only: other queries do not pay for it.
+
+    Arguments:
+    - engines: Engines to listen to, both engines of the API by default.
+
+    Returns:
+    - The list of the SQL statements, filled as they are executed.
+    """
+    engines = engines or (engine, async_engine.sync_engine)
+    for counted in engines:
+        if _COUNTING.get(counted, 0) == 0:
+            event.listen(counted, "before_cursor_execute", count_query)
+        _COUNTING[counted] = _COUNTING.get(counted, 0) + 1
+    statements: List[str] = []
+    token = QUERY_COUNT.set(statements)
+    try:
+        yield statements
+    finally:
+        QUERY_COUNT.reset(token)
+        for counted in engines:
+            _COUNTING[counted] -= 1
+            if _COUNTING[counted] == 0:
+                del _COUNTING[counted]
+                event.remove(counted, "before_cursor_execute", count_query)
+
 
 def get_db() -> Session:
     """
@@ -40,3 +104,20 @@ def get_db() -> Session:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncSession:
+    """
+    Asynchronous generator that manages the database session.
+
+    Same as get_db, but the session runs on the asyncio engine so that
+    queries awaited by async route handlers do not block the event loop.
+
+    Returns:
+    - db: An AsyncSession instance to interact with the database.
+    """
+    db = AsyncSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
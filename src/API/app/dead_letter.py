@@ -0,0 +1,242 @@
+import asyncio
+import json
+import os
+import queue
+import sys
+import threading
+import traceback
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from metrics import DEAD_LETTER_ROWS
+
+FILE_NAME = "dead_letter.ndjson"
+
+
+class DeadLetterSink:
+    """
+    Append-only sink of the rows the API failed to write to the database.
+
+    Each row is one JSON line {"kind", "failed_at", "error", "row"}, kind
+    being "recommendation" (a movies_users_rating row of the recommendation
+    log) or "rating" (a userId, movieId, rating to apply with the user's
+    features). put() only queues the rows: a daemon thread appends them to
+    path/dead_letter.ndjson by batches, every flush_interval seconds, so
+    that the event loop never waits for the disk. The file is rotated at
+    max_bytes, keeping backup_count files (dead_letter.ndjson.1 being the
+    most recent). Rows are replayed by `python dead_letter.py`.
+
+    Attributes:
+    - path: Directory of the dead letter files.
+    - max_bytes: Size at which the file is rotated.
+    - backup_count: Number of rotated files kept.
+    - flush_interval: Seconds between two writes.
+    """
+
+    def __init__(self, path: Path, max_bytes: int = 10 * 2 ** 20,
+                 backup_count: int = 5, flush_interval: float = 1.) -> None:
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self._queue: "queue.SimpleQueue[str]" = queue.SimpleQueue()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def file(self) -> Path:
+        """
+        The file rows are appended to.
+        """
+        return self.path / FILE_NAME
+
+    def put(self, kind: str, rows: List[Dict], error: BaseException) -> None:
+        """
+        Queues failed rows. Never blocks.
+
+        Arguments:
+        - kind: "recommendation" or "rating".
+        - rows: The rows that could not be written.
+        - error: The exception raised by the write.
+        """
+        failed_at = datetime.now(timezone.utc).isoformat()
+        error = f"{type(error).__name__}: {error}".splitlines()[0]
+        for row in rows:
+            self._queue.put(json.dumps(
+                {"kind": kind, "failed_at": failed_at, "error": error, "row": row},
+                default=str))
+        DEAD_LETTER_ROWS.labels(kind=kind).inc(len(rows))
+
+    def flush(self) -> int:
+        """
+        Appends the queued rows to the file, rotating it if needed.
+
+        Returns:
+        - The number of rows written.
+        """
+        lines = []
+        while True:
+            try:
+                lines.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if not lines:
+            return 0
+        self.path.mkdir(parents=True, exist_ok=True)
+        if self.file.is_file() and self.file.stat().st_size >= self.max_bytes:
+            self.rotate()
+        with open(self.file, "a") as f:
+            f.write("\n".join(lines) + "\n")
+        return len(lines)
+
+    def rotate(self) -> None:
+        """
+        Renames dead_letter.ndjson to dead_letter.ndjson.1, shifting the
+        older files and dropping the oldest one.
+        """
+        for i in range(self.backup_count - 1, 0, -1):
+            older = self.path / f"{FILE_NAME}.{i}"
+            if older.is_file():
+                os.replace(older, self.path / f"{FILE_NAME}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.file, self.path / f"{FILE_NAME}.1")
+        else:
+            self.file.unlink()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self._flush_logged()
+        self._flush_logged()
+
+    def _flush_logged(self) -> None:
+        try:
+            self.flush()
+        except OSError:
+            print("Dead letter rows not written:", traceback.format_exc(limit=3))
+
+    def start(self) -> None:
+        """
+        Starts writing the queued rows in a daemon thread.
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="dead-letter", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Writes the remaining rows and stops the writing thread.
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+
+DEAD_LETTER = DeadLetterSink(
+    Path(os.environ.get("DEAD_LETTER_PATH", "/app/data/dead_letter")),
+    max_bytes=int(os.environ.get("DEAD_LETTER_MAX_BYTES", 10 * 2 ** 20)),
+    backup_count=int(os.environ.get("DEAD_LETTER_BACKUP_COUNT", 5)))
+
+
+def read_dead_letters(path: Path) -> Dict[str, List[Dict]]:
+    """
+    Moves the dead letter files of a directory aside and reads them.
+
+    The files are renamed replay.* first, so that rows failing while the
+    replay runs go to a new file. Rows are returned oldest first.
+
+    Returns:
+    - Rows by kind.
+    """
+    path = Path(path)
+    files = sorted(path.glob(f"{FILE_NAME}.*[0-9]"),
+                   key=lambda f: int(f.suffix[1:]), reverse=True)
+    if (path / FILE_NAME).is_file():
+        files.append(path / FILE_NAME)
+    # Files left by an interrupted replay sort first
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    for i, file in enumerate(files):
+        os.replace(file, path / f"replay.{stamp}.{i:03d}")
+    rows = defaultdict(list)
+    for replay in sorted(path.glob("replay.*")):
+        with open(replay) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    rows[record["kind"]].append(record["row"])
+    return rows
+
+
+async def replay(path: Path, batch_size: int = 500) -> Dict[str, int]:
+    """
+    Retries the dead letter rows of a directory in bulk.
+
+    Recommendations are inserted batch_size rows per statement (rows
+    already there are skipped). Ratings are applied with one statement per
+    user (once the user is locked), which also updates the user's features. Rows failing again are
+    written back to the dead letter file. Replayed files are removed.
+
+    Returns:
+    - The number of rows replayed and failed again.
+    """
+    from sqlalchemy.dialects.postgresql import insert
+    from sqlalchemy.exc import SQLAlchemyError
+    from datamodel import MovieUserRating
+    from db_manager import AsyncSessionLocal
+    from route.recommandation import MovieSchema, lock_user_statement, rate_movies_statement, ratings_values
+
+    path = Path(path)
+    sink = DeadLetterSink(path)
+    rows = read_dead_letters(path)
+    counts = {"replayed": 0, "failed": 0}
+    async with AsyncSessionLocal() as db:
+        recommendations = rows.get("recommendation", [])
+        for i in range(0, len(recommendations), batch_size):
+            batch = recommendations[i:i + batch_size]
+            for row in batch:
+                if row.get("timestamp") is not None:
+                    row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+            try:
+                await db.execute(insert(MovieUserRating.__table__)
+                                 .values(batch).on_conflict_do_nothing())
+                await db.commit()
+                counts["replayed"] += len(batch)
+            except SQLAlchemyError as e:
+                await db.rollback()
+                sink.put("recommendation", batch, e)
+                counts["failed"] += len(batch)
+
+        ratings = defaultdict(list)
+        for row in rows.get("rating", []):
+            # Later rows of a movie win, as in the original requests
+            ratings[row["userId"]].append(
+                MovieSchema(moviesId=row["movieId"], rating=row["rating"]))
+        for user_id, movies in ratings.items():
+            try:
+                await db.execute(lock_user_statement(user_id))
+                await db.execute(rate_movies_statement(
+                    user_id, ratings_values(movies)))
+                await db.commit()
+                counts["replayed"] += len(movies)
+            except SQLAlchemyError as e:
+                await db.rollback()
+                sink.put("rating", [{"userId": user_id, "movieId": m.moviesId,
+                                     "rating": m.rating} for m in movies], e)
+                counts["failed"] += len(movies)
+
+    sink.flush()
+    for replayed in path.glob("replay.*"):
+        replayed.unlink()
+    return counts
+
+
+if __name__ == "__main__":
+    # python dead_letter.py [directory], DEAD_LETTER_PATH by default
+    counts = asyncio.run(replay(Path(sys.argv[1]) if len(sys.argv) > 1 else DEAD_LETTER.path))
+    print(f"### {counts['replayed']} rows replayed, {counts['failed']} failed again")
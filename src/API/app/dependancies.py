@@ -5,19 +5,37 @@ from pydantic import BaseModel
 from passlib.context import CryptContext
 from typing import Optional
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import os
 
 # DB package
 from sqlalchemy.orm import Session
 from db_manager import Client, get_db
+from cache import TTLCache
+from metrics import CLIENT_CACHE_REQUESTS
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# bcrypt costs tens to hundreds of ms of CPU (and releases the GIL): it runs
+# on a small pool, and concurrent logins are capped so that a login storm
+# queues instead of starving the pool and the event loop.
+PASSWORD_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("PASSWORD_WORKERS", 2)),
+    thread_name_prefix="bcrypt")
+PASSWORD_SEMAPHORE = asyncio.Semaphore(
+    int(os.environ.get("MAX_CONCURRENT_LOGINS", 8)))
+
 SECRET_KEY = os.environ["SECRET_API"]
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRATION = 60 * 24 * 15  # 15 days
 
+# Authenticated clients by username, so that a valid token costs no query
+CLIENTS = TTLCache(
+    maxsize=int(os.environ.get("CLIENT_CACHE_SIZE", 1024)),
+    ttl=float(os.environ.get("CLIENT_CACHE_TTL", 60)))
+
 
 class Token(BaseModel):
     """
@@ -70,6 +88,30 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+async def run_password_task(func, *args):
+    """
+    Runs a bcrypt function on PASSWORD_EXECUTOR, at most
+    MAX_CONCURRENT_LOGINS at a time, without blocking the event loop.
+    """
+    async with PASSWORD_SEMAPHORE:
+        return await asyncio.get_running_loop().run_in_executor(
+            PASSWORD_EXECUTOR, func, *args)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """
+    Same as verify_password, run off the event loop (see run_password_task).
+    """
+    return await run_password_task(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """
+    Same as get_password_hash, run off the event loop (see run_password_task).
+    """
+    return await run_password_task(get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
     """
     Creates an access JWT token with an expiration date.
@@ -105,10 +147,49 @@ def get_user(db: Session, username: str):
     return db.query(Client).filter(Client.username == username).first()
 
 
+def get_cached_user(db: Session, username: str):
+    """
+    Retrieves a user by username, from CLIENTS when possible.
+
+    Found users are cached for CLIENT_CACHE_TTL seconds, unknown usernames
+    are not cached.
+
+    Arguments:
+    - db: Database session, only used on a cache miss.
+    - username: Username to search for.
+
+    Returns:
+    - The found user, or None if no user is found.
+    """
+    user = CLIENTS.get(username)
+    if user is not None:
+        CLIENT_CACHE_REQUESTS.labels(result="hit").inc()
+        return user
+    CLIENT_CACHE_REQUESTS.labels(result="miss").inc()
+    user = get_user(db, username)
+    if user is not None:
+        CLIENTS.set(username, user)
+    return user
+
+
+def invalidate_client(username: str) -> None:
+    """
+    Removes a client from CLIENTS. To be called whenever a client is
+    created, changed or deleted.
+
+    Arguments:
+    - username: Username of the client.
+    """
+    CLIENTS.pop(username)
+
+
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     """
     Retrieves the current user from the JWT token.
 
+    The user is looked up in CLIENTS first: for a cached client, the request
+    costs no database round trip (the session is never used).
+
     Arguments:
     - token: JWT token obtained via OAuth2.
     - db: Database session.
@@ -132,7 +213,7 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = get_user(db, username=token_data.username)
+    user = get_cached_user(db, username=token_data.username)
     if user is None:
         raise credentials_exception
     return user
@@ -0,0 +1,119 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from metrics import INFERENCE_PENDING, INFERENCE_WAIT
+from model_store import LoadedModel, load_model
+
+# Models loaded by a worker process, by (source, version)
+_WORKER_MODELS: Dict[Tuple[str, str], Any] = {}
+# Models kept by a worker process (primary, canary and shadow, plus the
+# version being replaced during a reload)
+_WORKER_MAX_MODELS = 4
+
+
+def timed_kneighbors(model: Any, X: np.ndarray, submitted_at: float) -> Tuple[float, float, np.ndarray]:
+    """
+    Calls model.kneighbors(X) and returns the time the call waited in the
+    executor, its duration and the neighbour indices.
+    """
+    start = time.monotonic()
+    _, indices = model.kneighbors(X)
+    return start - submitted_at, time.monotonic() - start, np.asarray(indices)
+
+
+def worker_kneighbors(source: str, version: str, X: np.ndarray,
+                      submitted_at: float) -> Tuple[float, float, np.ndarray]:
+    """
+    timed_kneighbors in a worker process, on the process' own copy of the
+    model (memory-mapped artifacts share their pages with the API process).
+    """
+    model = _WORKER_MODELS.get((source, version))
+    if model is None:
+        while len(_WORKER_MODELS) >= _WORKER_MAX_MODELS:
+            _WORKER_MODELS.pop(next(iter(_WORKER_MODELS)))
+        model = _WORKER_MODELS[(source, version)] = load_model(Path(source))
+    return timed_kneighbors(model, X, submitted_at)
+
+
+class InferencePool:
+    """
+    Dedicated executor for the model calls, keeping the event loop free
+    while they run.
+
+    With kind "thread", the calls run on the process' models in a thread
+    pool (scikit-learn and NumPy release the GIL in their compiled parts).
+    With kind "process", worker processes load their own copy of each model
+    version on first use. Before start() (or with kind "inline"), calls run
+    on the event loop.
+
+    Attributes:
+    - kind: "thread", "process" or "inline".
+    - workers: Number of threads or processes.
+    """
+
+    def __init__(self, kind: str = "thread", workers: int = 4) -> None:
+        if kind not in ("thread", "process", "inline"):
+            raise ValueError(f"Unknown inference executor {kind!r}")
+        self.kind = kind
+        self.workers = workers
+        self._executor: Optional[Executor] = None
+
+    @property
+    def running(self) -> bool:
+        """
+        True between start() and stop(): calls run in the executor.
+        """
+        return self._executor is not None
+
+    def start(self) -> None:
+        """
+        Creates the executor (nothing to do for kind "inline").
+        """
+        if self._executor is not None or self.kind == "inline":
+            return
+        if self.kind == "thread":
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="inference")
+        else:
+            # Not forked: the API process runs threads
+            self._executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def stop(self) -> None:
+        """
+        Waits for the running calls and shuts the executor down.
+        """
+        if self._executor is None:
+            return
+        executor, self._executor = self._executor, None
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    async def kneighbors(self, loaded: LoadedModel, X: np.ndarray) -> Tuple[float, np.ndarray]:
+        """
+        Runs loaded.model.kneighbors(X) in the executor.
+
+        Returns:
+        - The duration of the model call and the neighbour indices.
+        """
+        submitted_at = time.monotonic()
+        if self._executor is None:
+            _, duration, indices = timed_kneighbors(loaded.model, X, submitted_at)
+            return duration, indices
+
+        if self.kind == "process" and loaded.source is not None:
+            call = (worker_kneighbors, str(loaded.source), loaded.version, X, submitted_at)
+        else:
+            call = (timed_kneighbors, loaded.model, X, submitted_at)
+        INFERENCE_PENDING.inc()
+        try:
+            wait, duration, indices = await asyncio.get_running_loop()\
+                .run_in_executor(self._executor, *call)
+        finally:
+            INFERENCE_PENDING.dec()
+        INFERENCE_WAIT.observe(wait)
+        return duration, indices
@@ -0,0 +1,119 @@
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from prometheus_client import Counter, Gauge, Histogram, Info
+
+# Custom metrics, exposed on /metrics next to the ones of
+# prometheus_fastapi_instrumentator (same default registry).
+
+# Model metrics are labelled by role: "primary", "canary" or "shadow"
+MODEL_INFO = Info(
+    "recommendation_model",
+    "Version of the models serving recommendations",
+    ["role"]
+)
+MODEL_LOADED_AT = Gauge(
+    "recommendation_model_loaded_timestamp_seconds",
+    "Unix time at which the serving model was loaded",
+    ["role"]
+)
+MODEL_LOAD_DURATION = Gauge(
+    "recommendation_model_load_duration_seconds",
+    "Time taken to load the serving model",
+    ["role"]
+)
+MODEL_RELOADS = Counter(
+    "recommendation_model_reloads_total",
+    "Model (re)load attempts",
+    ["role", "result"]
+)
+MODEL_INFERENCE_DURATION = Histogram(
+    "recommendation_model_inference_duration_seconds",
+    "Time taken by a model call, by model version and role",
+    ["version", "role"],
+    buckets=(.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25)
+)
+MODEL_AGREEMENT = Counter(
+    "recommendation_model_agreement_total",
+    "Shadow model calls whose three best genres match the primary model's",
+    ["version", "result"]
+)
+MODEL_BATCH_SIZE = Histogram(
+    "recommendation_model_batch_size",
+    "Rows of each coalesced model call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+MODEL_BATCH_WAIT = Histogram(
+    "recommendation_model_batch_wait_seconds",
+    "Time a row waits for its coalesced model call",
+    buckets=(.00005, .0001, .00025, .0005, .001, .0025, .005, .01, .025)
+)
+INFERENCE_PENDING = Gauge(
+    "recommendation_inference_pending",
+    "Model calls submitted to the inference executor and not finished"
+)
+INFERENCE_WAIT = Histogram(
+    "recommendation_inference_wait_seconds",
+    "Time a model call waits for an inference worker",
+    buckets=(.00005, .0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1)
+)
+COALESCED_REQUESTS = Counter(
+    "api_coalesced_requests_total",
+    "Requests served by the computation of an identical request in flight",
+    ["name"]
+)
+SHADOW_SKIPPED = Counter(
+    "recommendation_shadow_skipped_total",
+    "Shadow model calls skipped because the shadow backlog was full"
+)
+RESULT_CACHE_REQUESTS = Counter(
+    "recommendation_result_cache_requests_total",
+    "Lookups of the per-user recommendation cache",
+    ["result"]
+)
+CLIENT_CACHE_REQUESTS = Counter(
+    "api_client_cache_requests_total",
+    "Lookups of the authenticated client cache",
+    ["result"]
+)
+WRITE_BEHIND_QUEUE_DEPTH = Gauge(
+    "recommendation_log_queue_depth",
+    "Recommendation rows waiting to be written to the database"
+)
+WRITE_BEHIND_FLUSH_DURATION = Histogram(
+    "recommendation_log_flush_duration_seconds",
+    "Time taken to write a batch of recommendation rows"
+)
+WRITE_BEHIND_ROWS = Counter(
+    "recommendation_log_rows_total",
+    "Recommendation rows flushed to the database",
+    ["result"]
+)
+DEAD_LETTER_ROWS = Counter(
+    "api_dead_letter_rows_total",
+    "Rows that could not be written to the database, sent to the dead letter file",
+    ["kind"]
+)
+STAGE_DURATION = Histogram(
+    "recommendation_stage_duration_seconds",
+    "Time spent in each stage of the recommendation pipeline",
+    ["stage", "outcome"],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5.)
+)
+
+
+@contextmanager
+def observe_stage(stage: str) -> Iterator[None]:
+    """
+    Times a stage of the recommendation pipeline in STAGE_DURATION, with
+    outcome "success", or "error" if the block raised.
+    """
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "success"
+    finally:
+        STAGE_DURATION.labels(stage=stage, outcome=outcome)\
+            .observe(time.perf_counter() - start)
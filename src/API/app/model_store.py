@@ -0,0 +1,255 @@
+import json
+import pickle
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from user_index import IVFUserIndex
+from metrics import MODEL_INFO, MODEL_LOADED_AT, MODEL_LOAD_DURATION, MODEL_RELOADS
+
+
+class MmapNeighbors:
+    """
+    Nearest neighbours model served from a memory-mapped artifact.
+
+    The artifact is a directory written by the train-model image:
+    - metadata.json: version, feature_names, n_neighbors, ...
+    - fit_X.npy: the fitted data (n_samples x n_features, float64).
+    - fit_X_sq_norms.npy: squared norms of the rows of fit_X.
+    - popularity_movie_ids.npy, popularity_offsets.npy (optional): movie
+      IDs of each genre ranked by popularity, in CSR layout, the genres
+      being listed in metadata["popularity_genres"].
+    - users_*.npy, ivf_*.npy (optional): the IVF user index, its parameters
+      being metadata["user_index"] (see IVFUserIndex).
+
+    Arrays are opened with np.load(mmap_mode="r"): loading takes
+    milliseconds and the pages are shared through the OS page cache by all
+    the workers of a node. kneighbors is an exact euclidean search, so it
+    returns the same neighbours as the fitted NearestNeighbors (up to the
+    order of equidistant points, broken here by row index).
+
+    Attributes:
+    - feature_names_in_: Names of the features, in fit order.
+    - n_neighbors: Number of neighbours returned by kneighbors.
+    - metadata: Content of metadata.json.
+    - popularity: Genre -> ranked movie IDs, None if the artifact has none.
+    - user_index: IVFUserIndex, None if the artifact has none.
+    """
+
+    def __init__(self, path: Path) -> None:
+        path = Path(path)
+        with open(path / "metadata.json") as f:
+            self.metadata = json.load(f)
+        self.feature_names_in_ = np.asarray(
+            self.metadata["feature_names"], dtype=object)
+        self.n_neighbors = self.metadata["n_neighbors"]
+        self.fit_X = np.load(path / "fit_X.npy", mmap_mode="r")
+        self.sq_norms = np.load(path / "fit_X_sq_norms.npy", mmap_mode="r")
+        self.popularity: Optional[Dict[str, np.ndarray]] = None
+        if "popularity_genres" in self.metadata:
+            movie_ids = np.load(path / "popularity_movie_ids.npy", mmap_mode="r")
+            offsets = np.load(path / "popularity_offsets.npy")
+            self.popularity = {
+                genre: movie_ids[offsets[i]:offsets[i + 1]]
+                for i, genre in enumerate(self.metadata["popularity_genres"])
+            }
+        self.user_index: Optional[IVFUserIndex] = None
+        if "user_index" in self.metadata:
+            self.user_index = IVFUserIndex(path, self.metadata["user_index"])
+
+    def kneighbors(self, X, n_neighbors: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the nearest neighbours of each row of X.
+
+        Arguments:
+        - X: Array-like of shape (n_queries, n_features).
+        - n_neighbors: Defaults to the n_neighbors of the fitted model.
+
+        Returns:
+        - (distances, indices), both of shape (n_queries, n_neighbors),
+          sorted by increasing distance.
+        """
+        k = n_neighbors or self.n_neighbors
+        X = np.asarray(X, dtype=np.float64)
+        sq_dist = self.sq_norms[None, :] - 2 * X @ self.fit_X.T \
+            + np.einsum("ij,ij->i", X, X)[:, None]
+        nearest = np.argpartition(sq_dist, k - 1, axis=1)[:, :k]
+        nearest_dist = np.take_along_axis(sq_dist, nearest, axis=1)
+        order = np.lexsort((nearest, nearest_dist), axis=1)
+        indices = np.take_along_axis(nearest, order, axis=1)
+        distances = np.sqrt(np.maximum(
+            np.take_along_axis(nearest_dist, order, axis=1), 0))
+        return distances, indices
+
+
+class LoadedModel(NamedTuple):
+    """
+    A model with the version it was loaded from.
+
+    Attributes:
+    - model: The fitted estimator.
+    - version: Version of the model (artifact version, or modification
+      time of a pickle file).
+    - loaded_at: Unix time at which it was loaded.
+    - source: Artifact directory or pickle file it was loaded from.
+    """
+    model: Any
+    version: str
+    loaded_at: float
+    source: Optional[Path] = None
+
+
+def load_model(source: Path) -> Any:
+    """
+    Loads a model from an artifact directory (see MmapNeighbors) or a
+    pickle file.
+    """
+    if source.is_dir():
+        return MmapNeighbors(source)
+    with open(source, mode="rb") as f:
+        return pickle.load(f)
+
+
+class ModelStore:
+    """
+    Holds the model serving recommendations and hot-reloads it.
+
+    The store serves either a versioned artifact directory (see
+    MmapNeighbors) or a pickled model:
+    - if path is a directory with a pointer file (LATEST by default), it
+      holds the version (subdirectory name) to serve;
+    - if path is a directory without it, path/model.pkl is served, unless
+      the store is optional (a canary or shadow model): it then serves
+      nothing;
+    - otherwise path is the pickle file itself.
+
+    A background thread watches the pointer (or the pickle file) and loads
+    a new version as soon as it changes. The new model is published by replacing
+    `current` in one assignment: requests read `current` once and finish
+    on the model they started with, while the next ones use the new one.
+    If a new file cannot be loaded, the previous model keeps serving.
+
+    Attributes:
+    - path: Models directory, or path of a pickled model.
+    - poll_interval: Seconds between two checks of the file.
+    - on_load: Optional callback, called with each newly published
+      LoadedModel.
+    - pointer: Name of the file holding the version to serve.
+    - role: Label of the store's metrics ("primary", "canary", "shadow").
+    - optional: Whether a missing pointer means no model (instead of
+      model.pkl).
+    - current: The LoadedModel in use, None until the first load (or while
+      an optional store has no pointer).
+    """
+
+    def __init__(self, path: Path, poll_interval: float = 60.,
+                 on_load: Optional[Callable[[LoadedModel], None]] = None,
+                 pointer: str = "LATEST", role: str = "primary",
+                 optional: bool = False) -> None:
+        self.path = Path(path)
+        self.poll_interval = poll_interval
+        self.on_load = on_load
+        self.pointer = pointer
+        self.role = role
+        self.optional = optional
+        self.current: Optional[LoadedModel] = None
+        self._stamp = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def model(self) -> Any:
+        """
+        The model in use.
+        """
+        return self.current.model
+
+    def load(self) -> bool:
+        """
+        Loads the model file if it changed since the last load.
+
+        Returns:
+        - True if a new model was published, False otherwise.
+
+        Exceptions:
+        - Any loading error when no model has been loaded yet (only logged
+          by optional stores).
+        """
+        latest = self.path / self.pointer
+        if latest.is_file():
+            version = latest.read_text().strip()
+            source = self.path / version
+            stamp = version
+        elif self.optional:
+            # Pointer removed (e.g. canary rolled back): stop serving
+            if self.current is None:
+                return False
+            print(f"No {self.role} model anymore, was version {self.current.version}")
+            self.current, self._stamp = None, None
+            MODEL_INFO.labels(role=self.role).info({"version": "", "path": ""})
+            return True
+        else:
+            source = self.path / "model.pkl" if self.path.is_dir() else self.path
+            stat = source.stat()
+            version = datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)\
+                .strftime("%Y%m%dT%H%M%S")
+            stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp:
+            return False
+
+        start = time.perf_counter()
+        try:
+            model = load_model(source)
+        except Exception:
+            MODEL_RELOADS.labels(role=self.role, result="failure").inc()
+            if self.current is None and not self.optional:
+                raise
+            kept = "no model" if self.current is None else f"version {self.current.version}"
+            print(f"Model reload failed, keeping {self.role} {kept}:",
+                  traceback.format_exc(limit=3))
+            return False
+
+        self.current = LoadedModel(model, version, time.time(), source)
+        self._stamp = stamp
+        if self.on_load is not None:
+            self.on_load(self.current)
+
+        MODEL_RELOADS.labels(role=self.role, result="success").inc()
+        MODEL_LOAD_DURATION.labels(role=self.role).set(time.perf_counter() - start)
+        MODEL_LOADED_AT.labels(role=self.role).set(self.current.loaded_at)
+        MODEL_INFO.labels(role=self.role).info({"version": version, "path": str(source)})
+        return True
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                if self.load() and self.current is not None:
+                    print(f"Model reloaded, {self.role} version {self.current.version}")
+            except OSError as e:
+                print(f"Model file not readable: {e}")
+
+    def start(self) -> None:
+        """
+        Starts watching the model file in a daemon thread.
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._watch, name=f"model-reloader-{self.role}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops the watching thread.
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
@@ -0,0 +1,90 @@
+import asyncio
+import time
+from typing import Dict
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import SQLAlchemyError
+
+import catalog
+from catalog import load_catalog
+from db_manager import AsyncSessionLocal
+from route.recommandation import CANARY_STORE, MODEL_STORE, SHADOW_STORE
+
+health_router = APIRouter()
+
+# Seconds between two attempts to load the model or the catalog
+RETRY_INTERVAL = 5.
+
+# time.monotonic() of the start of the warm-up and of readiness
+STARTED_AT = time.monotonic()
+READY_AT = None
+
+
+def readiness() -> Dict:
+    """
+    Returns what the API still waits for before serving recommendations.
+    """
+    loaded = MODEL_STORE.current
+    return {
+        "ready": loaded is not None and catalog.CATALOG is not None,
+        "model": None if loaded is None else loaded.version,
+        "catalog": catalog.CATALOG is not None,
+    }
+
+
+async def warm_up(retry_interval: float = RETRY_INTERVAL) -> None:
+    """
+    Loads the model, then the catalog, retrying until both succeed.
+
+    Run in the background by the app lifespan, so that the server accepts
+    connections (and answers /health/live) at once. The model is loaded in
+    a worker thread, then watched for new versions. The canary and shadow
+    models are loaded once after it, readiness does not wait for them.
+    """
+    global STARTED_AT, READY_AT
+    STARTED_AT, READY_AT = time.monotonic(), None
+    while MODEL_STORE.current is None:
+        try:
+            await asyncio.to_thread(MODEL_STORE.load)
+        except Exception as e:
+            print(f"Model not loaded yet: {e!r}")
+            await asyncio.sleep(retry_interval)
+    MODEL_STORE.start()
+    for store in (CANARY_STORE, SHADOW_STORE):
+        try:
+            await asyncio.to_thread(store.load)
+        except OSError as e:
+            print(f"No {store.role} model loaded: {e!r}")
+        store.start()
+
+    while catalog.CATALOG is None:
+        try:
+            async with AsyncSessionLocal() as db:
+                await load_catalog(db)
+        except (SQLAlchemyError, OSError) as e:
+            print(f"Catalog not loaded yet: {e!r}")
+            await asyncio.sleep(retry_interval)
+    READY_AT = time.monotonic()
+    print(f"Ready to serve in {READY_AT - STARTED_AT:.2f} s, "
+          f"model version {MODEL_STORE.current.version}")
+
+
+@health_router.get("/health/live", tags=["Health"])
+async def live() -> Dict:
+    """
+    Liveness probe: the process answers requests.
+    """
+    return {"status": "alive"}
+
+
+@health_router.get("/health/ready", tags=["Health"])
+async def ready():
+    """
+    Readiness probe: HTTP 200 once the model and the movies catalog are
+    loaded, HTTP 503 before (the body tells which one is missing).
+    """
+    state = readiness()
+    if READY_AT is not None:
+        state["ready_after_seconds"] = round(READY_AT - STARTED_AT, 3)
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
@@ -1,17 +1,18 @@
 from sqlalchemy.exc import IntegrityError
 from datamodel import Client
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import uuid
-from passlib.context import CryptContext
 from fastapi import APIRouter
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi import Depends, HTTPException
 from dependancies import ACCESS_TOKEN_EXPIRATION
 from dependancies import Token
-from dependancies import verify_password, create_access_token
+from dependancies import verify_password_async, get_password_hash_async
+from dependancies import create_access_token, invalidate_client
 from datetime import timedelta
-from db_manager import get_db
+from db_manager import get_async_db
 
 router_client = APIRouter()
 
@@ -32,12 +33,9 @@ class ClientCreate(BaseModel):
     password: str
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-
 @router_client.post("/create-client", tags=["Client"])
 async def create_client(
-        client: ClientCreate, db: Session = Depends(get_db)):
+        client: ClientCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Creates a new client in the database.
 
@@ -54,19 +52,19 @@ async def create_client(
     Returns:
     - A success message and the ID of the newly created client.
     """
-    existing_client = db.query(Client).filter(
-        Client.username == client.username).first()
+    existing_client = (await db.execute(select(Client).where(
+        Client.username == client.username))).scalars().first()
     if existing_client:
         raise HTTPException(
             status_code=400, detail="Client with this username already exists")
 
-    existing_email = db.query(Client).filter(
-        Client.email == client.email).first()
+    existing_email = (await db.execute(select(Client).where(
+        Client.email == client.email))).scalars().first()
     if existing_email:
         raise HTTPException(
             status_code=400, detail="Client with this email already exists")
 
-    hashed_password = pwd_context.hash(client.password)
+    hashed_password = await get_password_hash_async(client.password)
     new_client = Client(
         id=uuid.uuid4(),
         username=client.username,
@@ -77,19 +75,20 @@ async def create_client(
 
     try:
         db.add(new_client)
-        db.commit()
-        db.refresh(new_client)
+        await db.commit()
+        await db.refresh(new_client)
     except IntegrityError:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500, detail="Error creating the client")
+    invalidate_client(new_client.username)
 
     return {"message": "Client created successfully", "client_id": new_client.id}
 
 
 @router_client.post("/token", response_model=Token, tags=["Client"])
 async def login_for_access_token(
-        form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+        form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     """
     Authenticates a user and generates a JWT access token.
 
@@ -102,13 +101,13 @@ async def login_for_access_token(
     Returns:
     - A dictionary containing the access token and token type (Bearer).
     """
-    user = db.query(Client).filter(
-        Client.username == form_data.username).first()
+    user = (await db.execute(select(Client).where(
+        Client.username == form_data.username))).scalars().first()
     if not user:
         raise HTTPException(
             status_code=400, detail="Incorrect username or password")
 
-    if not verify_password(form_data.password, user.hashed_password):
+    if not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=400, detail="Incorrect username or password")
 
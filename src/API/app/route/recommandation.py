@@ -1,39 +1,116 @@
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Query
 from fastapi import APIRouter
 
 from pydantic import BaseModel
-from typing import Optional, List, Dict
-from datetime import datetime
-import pandas as pd
-
-from db_manager import get_db
-from sqlalchemy.exc import SQLAlchemyError, IntegrityError
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from typing import TYPE_CHECKING, Any, Optional, List, Dict, Sequence, Tuple, Literal
+
+from db_manager import get_async_db, AsyncSessionLocal
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import case, func, select, update, values, column, literal, literal_column, true, bindparam
+from sqlalchemy.orm import aliased
+from sqlalchemy import Integer, Float
+from sqlalchemy.dialects.postgresql import insert, ARRAY
 from dependancies import get_current_user
 from datamodel import Movie, MovieUserRating, User
-import pickle
+from catalog import get_catalog, set_popularity, GENRES
+from cache import TTLCache
+from model_store import LoadedModel, ModelStore
+from metrics import (MODEL_AGREEMENT, MODEL_INFERENCE_DURATION, RESULT_CACHE_REQUESTS,
+                     SHADOW_SKIPPED, observe_stage)
+from write_behind import WriteBehindBuffer
+from batcher import MicroBatcher
+from inference import InferencePool
+from singleflight import SingleFlight
+from dead_letter import DEAD_LETTER
 import os
+import secrets
+import threading
+import time
+import traceback
+import warnings
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
-from sklearn.neighbors import NearestNeighbors
 
-
-# Model Path Determination
-if "MAMBA_EXE" in os.environ:
-    model_path = Path(
-        "/home/romain/Documents/Formation/mai24_cmlops_film/models/model.pkl")
-elif "CONFIG_MODE" in os.environ and os.environ["CONFIG_MODE"] == "testing":
-    model_path = Path(
-        "/home/runner/work/mai24_cmlops_film/mai24_cmlops_film/models/model.pkl")
-else:
-    model_path = Path("/app/data/models/model.pkl")
-
-# Load Model
-with open(model_path, mode="rb") as f:
-    MODEL = pickle.load(f)
+if TYPE_CHECKING:
+    # Only the batch route needs pandas, imported on first use
+    import pandas as pd
+
+
+# Models directory (or pickle file), see ModelStore
+model_path = Path(os.environ.get("MODEL_PATH", "/app/data/models"))
+
+# Model (the memory-mapped artifact pointed by LATEST, else model.pkl),
+# loaded in the background by the app lifespan (see route.health), then
+# hot-reloaded when the train-model DAG publishes a new version. The
+# catalog follows the popularity lists of the artifact.
+MODEL_STORE = ModelStore(
+    model_path, poll_interval=float(os.environ.get("MODEL_RELOAD_INTERVAL", 60)),
+    on_load=lambda loaded: set_popularity(getattr(loaded.model, "popularity", None)))
+
+# Models under evaluation, published by the CANARY and SHADOW pointer
+# files of the models directory (none while the file is missing). The
+# canary serves CANARY_PERCENT % of the users (by userId), the shadow model
+# is queried off the request path and only compared with the served model.
+# Both rank genres only: the catalog follows the primary model
+CANARY_STORE = ModelStore(
+    model_path, poll_interval=MODEL_STORE.poll_interval,
+    pointer="CANARY", role="canary", optional=True)
+SHADOW_STORE = ModelStore(
+    model_path, poll_interval=MODEL_STORE.poll_interval,
+    pointer="SHADOW", role="shadow", optional=True)
+CANARY_PERCENT = float(os.environ.get("CANARY_PERCENT", 0))
+
+# Shadow model calls run in one worker thread, at most SHADOW_MAX_PENDING
+# waiting (further calls are skipped and counted)
+SHADOW_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow-model")
+SHADOW_SLOTS = threading.BoundedSemaphore(int(os.environ.get("SHADOW_MAX_PENDING", 64)))
+
+# Models are queried with NumPy arrays in the feature order they were
+# fitted with, a pickled sklearn model would warn on every call
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+# Samples the genre recommended among the three best ranked
+RNG = np.random.default_rng()
+
+# Number of similar users whose ratings feed the "similar_users" strategy
+N_SIMILAR_USERS = 50
+
+# Candidates sent by the first anti-join query, later queries send 4x more
+UNSEEN_CHUNK_SIZE = 256
+
+# Ranked lists kept server-side for cursor pagination, one per user
+# (the last one a cursor was issued for)
+RANKED_LIST_SIZE = 100
+RANKED_LISTS = TTLCache(
+    maxsize=int(os.environ.get("RANKED_LIST_CACHE_SIZE", 2048)),
+    ttl=float(os.environ.get("RANKED_LIST_TTL", 600)))
+
+# Per-user ranked lists, consumed by repeat requests without new ratings.
+# Entries are {"ranked": [...], "offset": number of movies already served,
+# "strategy": strategy that ranked them}
+USER_RESULTS = TTLCache(
+    maxsize=int(os.environ.get("RESULT_CACHE_SIZE", 10000)),
+    ttl=float(os.environ.get("RESULT_CACHE_TTL", 300)))
+
+# Recommended movies are logged to movies_users_rating in the background,
+# by batches (started and flushed by the app lifespan). Rows of failed
+# batches go to the dead letter file
+RECOMMENDATION_LOG = WriteBehindBuffer(
+    MovieUserRating.__table__, AsyncSessionLocal,
+    max_rows=int(os.environ.get("RECOMMENDATION_LOG_BATCH_SIZE", 500)),
+    flush_interval=float(os.environ.get("RECOMMENDATION_LOG_INTERVAL_MS", 50)) / 1000,
+    maxsize=int(os.environ.get("RECOMMENDATION_LOG_QUEUE_SIZE", 10000)),
+    on_failure=lambda rows, error: DEAD_LETTER.put("recommendation", rows, error))
 
 reco_router = APIRouter()
 
+# Concurrent identical POST /recommendations requests of a user (client
+# retries, duplicates) share one computation and one set of writes
+IN_FLIGHT = SingleFlight("recommendation")
+
 
 # Schema
 class MovieSchema(BaseModel):
@@ -86,225 +163,735 @@ class ResponseRecommendationSchema(BaseModel):
 
     Attributes:
     - userId: User identifier.
-    - recommendation: a movie recommended schema.
+    - recommendation: a movie recommended schema (first of recommendations).
+    - recommendations: The page of recommended movies, best ranked first.
+    - next_cursor: Cursor of the next page, null on the last page.
     """
     userId: int = None
     recommendation: MovieRecommendedSchema
+    recommendations: List[MovieRecommendedSchema] = []
+    next_cursor: Optional[str] = None
+
+
+class BatchUserSchema(BaseModel):
+    """
+    Schema representing one user of a batch recommendation request.
+
+    Attributes:
+    - userId: User identifier (optional, a new user is created if null).
+    - listMovie: Movies watched by the user and their ratings (optional).
+    """
+    userId: Optional[int] = None
+    listMovie: Optional[List[MovieSchema]] = []
+
+
+class BatchRecommendationSchema(BaseModel):
+    """
+    Schema representing a batch recommendation request.
+
+    Attributes:
+    - users: Users to recommend a movie to.
+    """
+    users: List[BatchUserSchema]
+
+
+class BatchItemRecommendationSchema(BaseModel):
+    """
+    Schema representing the recommendation of one user of a batch.
+
+    Attributes:
+    - userId: User identifier (null if the user could not be created).
+    - recommendation: The recommended movie, null on error.
+    - detail: Error message when no recommendation could be made.
+    """
+    userId: Optional[int] = None
+    recommendation: Optional[MovieRecommendedSchema] = None
+    detail: Optional[str] = None
+
+
+class ResponseBatchRecommendationSchema(BaseModel):
+    """
+    Schema representing a batch of recommendations.
+
+    Attributes:
+    - recommendations: One item per requested user, in request order.
+    """
+    recommendations: List[BatchItemRecommendationSchema]
 
 
-def create_user(db: Session) -> int:
+MAX_BATCH_SIZE = 500
+
+
+def ratings_values(movies: List[MovieSchema]):
+    """
+    Builds the VALUES ("movieId", rating) list of a batch of ratings.
+
+    Ratings are clipped to [0, 5] and a movie sent several times keeps the
+    last rating, so that one statement never writes the same row twice.
+
+    Returns:
+    - A SQLAlchemy VALUES construct named "new_ratings", or None if empty.
+    """
+    ratings = {movie.moviesId: max(0, min(5, movie.rating)) for movie in movies}
+    if not ratings:
+        return None
+    return values(
+        column("movieId", Integer), column("rating", Float), name="new_ratings"
+    ).data(list(ratings.items()))
+
+
+def now_seconds() -> datetime:
+    """
+    Current time to the second, the timestamp of the rows written by a
+    request.
     """
-    Creates a new user in the database by assigning them a new unique ID.
+    return datetime.now().replace(microsecond=0)
+
+
+def has_genre(genre: str):
+    """
+    SQL expression of a genre indicator of the joined movie: 1 if
+    Movie.genres lists the genre (normalized like catalog.normalize_genre),
+    else 0. Features are computed from the movies table itself, which knows
+    the movies added since the catalog was loaded.
+    """
+    labels = Movie.genres
+    for old, new in (("(", ""), (")", ""), (" ", "_"), ("-", "_")):
+        labels = func.replace(labels, old, new)
+    return case((func.strpos(func.concat("|", labels, "|"), f"|{genre}|") > 0, 1), else_=0)
+
+
+def new_user_statement(new_ratings):
+    """
+    Builds the statement creating a user with its first ratings.
+
+    WITH new_user AS (INSERT INTO users ... SELECT <features> ...
+    RETURNING ...), added AS (INSERT INTO movies_users_rating ...) SELECT:
+    the user row is inserted with its features (mean genre indicators of
+    the rated movies) already computed. Unknown movie IDs are skipped; if
+    none exist, no user is created and the statement returns no row.
+
+    Returns:
+    - A statement returning one row: userId, the features in GENRES order
+      and "added", the number of movies rated.
+    """
+    rated = select(
+        func.count(), *[func.avg(has_genre(genre)) for genre in GENRES]
+    ).select_from(new_ratings)\
+        .join(Movie, Movie.movieId == new_ratings.c.movieId)\
+        .having(func.count() > 0)
+    new_user = insert(User).from_select(["count_movies", *GENRES], rated)\
+        .returning(User.userId, *[getattr(User, g) for g in GENRES])\
+        .cte("new_user")
+    added = insert(MovieUserRating).from_select(
+        ["userId", "movieId", "rating", "timestamp"],
+        select(
+            new_user.c.userId, new_ratings.c.movieId, new_ratings.c.rating,
+            literal(now_seconds())
+        )
+        .select_from(new_user)
+        .join(new_ratings, true())
+        .join(Movie, Movie.movieId == new_ratings.c.movieId)
+    ).returning(MovieUserRating.movieId).cte("added")
+    return select(
+        new_user,
+        select(func.count()).select_from(added).scalar_subquery().label("added")
+    )
+
+
+def lock_user_statement(user_id: int):
+    """
+    Builds the statement locking a user's row until the end of the
+    transaction (SELECT ... FOR UPDATE).
+
+    To be executed before rate_movies_statement, as a separate statement:
+    concurrent ratings of the same user then run one after the other, and
+    each statement's snapshot (READ COMMITTED) sees the ratings committed
+    by the previous ones, so that a movie is folded into the features once.
+
+    Returns:
+    - A statement returning the userId (no row if the user doesn't exist).
+    """
+    return select(User.userId).where(User.userId == user_id).with_for_update()
+
+
+def rate_movies_statement(user_id: int, new_ratings):
+    """
+    Builds the statement writing ratings of an existing user and updating
+    its features.
+
+    WITH upsert AS (INSERT ... ON CONFLICT DO UPDATE RETURNING ...)
+    UPDATE users ... RETURNING: new movies are inserted, movies already in
+    the history get their rating and timestamp updated, unknown movie IDs
+    are skipped. Movies rated for the first time are folded into the
+    features from the running sums:
+    new_mean = (mean * count_movies + genre_count) / (count_movies + n)
+    The user must be locked first (see lock_user_statement).
+
+    Returns:
+    - A statement returning one row (none if the user doesn't exist):
+      userId, the features in GENRES order, "inserted" (new rows) and
+      "written" (inserted or updated rows).
+    """
+    # Movies already rated before this statement (rows written by
+    # save_recommendations have no rating yet)
+    already_rated = select(MovieUserRating.movieId).where(
+        MovieUserRating.userId == user_id,
+        MovieUserRating.rating.is_not(None),
+        MovieUserRating.movieId.in_(select(new_ratings.c.movieId))
+    ).cte("already_rated")
+    upsert = insert(MovieUserRating).from_select(
+        ["userId", "movieId", "rating", "timestamp"],
+        select(
+            literal(user_id, Integer), new_ratings.c.movieId, new_ratings.c.rating,
+            literal(now_seconds())
+        )
+        .select_from(new_ratings)
+        .join(Movie, Movie.movieId == new_ratings.c.movieId)
+        .where(select(User.userId).where(User.userId == user_id).exists())
+    )
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[MovieUserRating.userId, MovieUserRating.movieId],
+        set_={"rating": upsert.excluded.rating,
+              "timestamp": upsert.excluded.timestamp}
+    ).returning(
+        MovieUserRating.movieId,
+        # xmax is 0 for freshly inserted rows, set for updated ones
+        literal_column("xmax = 0").label("inserted")
+    ).cte("upsert")
+
+    fresh = select(
+        func.count().label("n"),
+        *[func.coalesce(func.sum(has_genre(genre)), 0).label(genre) for genre in GENRES]
+    ).select_from(upsert)\
+        .join(Movie, Movie.movieId == upsert.c.movieId)\
+        .where(upsert.c.movieId.not_in(select(already_rated.c.movieId)))\
+        .cte("fresh")
+
+    count_movies = func.coalesce(User.count_movies, 0)
+    new_count = count_movies + fresh.c.n
+    features = {
+        genre: (func.coalesce(getattr(User, genre), 0) * count_movies
+                + fresh.c[genre]) / func.greatest(new_count, 1)
+        for genre in GENRES
+    }
+    return update(User).where(User.userId == user_id)\
+        .values(count_movies=new_count, **features)\
+        .returning(
+            User.userId, *[getattr(User, g) for g in GENRES],
+            select(func.count()).select_from(upsert).where(upsert.c.inserted)
+            .scalar_subquery().label("inserted"),
+            select(func.count()).select_from(upsert)
+            .scalar_subquery().label("written")
+        )
+
+
+def dead_letter_ratings(user_id: int, movies: List[MovieSchema], error: BaseException) -> None:
+    """
+    Sends ratings that could not be written to the dead letter file, to be
+    replayed later (see dead_letter.replay).
+    """
+    DEAD_LETTER.put("rating", [
+        {"userId": user_id, "movieId": movie.moviesId, "rating": movie.rating}
+        for movie in movies], error)
+
+
+def features_vector(row) -> np.ndarray:
+    """
+    Returns the genre features of a row having userId and genre attributes,
+    as a float array in GENRES order (NaN for NULL features).
+    """
+    return np.array([getattr(row, g) for g in GENRES], dtype=np.float64)
+
+
+def select_model(user_id: Optional[int] = None) -> Tuple[str, LoadedModel]:
+    """
+    Chooses the model serving a user: the canary for the users whose
+    userId % 100 is below CANARY_PERCENT (while a canary is loaded), the
+    primary model otherwise.
+
+    Arguments:
+    - user_id: The ID of the user, None to always use the primary model.
+
+    Exceptions:
+    - HTTP 503: If the primary model is not loaded yet.
+
+    Returns:
+    - The role ("primary" or "canary") and the loaded model.
+    """
+    loaded = MODEL_STORE.current
+    if loaded is None:
+        raise HTTPException(status_code=503, detail="Model not loaded yet")
+    canary = CANARY_STORE.current
+    if canary is not None and user_id is not None and user_id % 100 < CANARY_PERCENT:
+        return "canary", canary
+    return "primary", loaded
+
+
+def serving_model(user_id: Optional[int] = None):
+    """
+    Returns the model serving recommendations (to a user, see select_model).
+
+    Exceptions:
+    - HTTP 503: If the model is not loaded yet.
+    """
+    return select_model(user_id)[1].model
+
+
+def features_frame(rows) -> "pd.DataFrame":
+    """
+    Builds the feature DataFrame (indexed by userId, one column per genre
+    in GENRES order) of rows having userId and genre attributes.
+    """
+    import pandas as pd
+    return pd.DataFrame(
+        [[getattr(row, g) for g in GENRES] for row in rows], columns=GENRES,
+        index=pd.Index([row.userId for row in rows], name="userId"))
+
+
+async def create_user_with_movies(db: AsyncSession, movies: List[MovieSchema]) -> Tuple[int, int]:
+    """
+    Creates a new user together with its first ratings and features in one
+    statement (see new_user_statement).
+
+    Unknown movie IDs are skipped. If none of the movies exist, no user is
+    created.
 
     Arguments:
     - db: Database session.
+    - movies: List of movies with their ratings.
 
     Exceptions:
+    - HTTP 400: If none of the movie IDs provided exist.
     - HTTP 500: In case of database error.
 
     Returns:
-    - The ID of the newly created user.
+    - A tuple (user ID, number of movies added).
     """
+    new_ratings = ratings_values(movies)
+    if new_ratings is None:
+        raise HTTPException(
+            status_code=400, detail="Missing movie history"
+        )
+
     try:
-        max_id = db.query(func.max(User.userId)).scalar()
-        new_user = User(userId=max_id + 1)
-        db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
-        return new_user.userId
+        row = (await db.execute(new_user_statement(new_ratings))).first()
+        if row is not None:
+            await db.commit()
     except SQLAlchemyError:
+        await db.rollback()
         raise HTTPException(status_code=500,
                             detail="Error creating user in the database")
 
+    if row is None:
+        raise HTTPException(
+            status_code=400, detail="Missing movie history (Movie IDs provided don't exist)"
+        )
+    return row.userId, row.added
+
 
-def get_user_history(db: Session, user_id: int) -> List[int]:
+async def get_users_history(db: AsyncSession, user_ids: List[int]) -> Dict[int, List[int]]:
     """
-    Retrieves the movie viewing history of a given user.
+    Retrieves the movie viewing history of several users in one query.
 
     Arguments:
     - db: Database session.
-    - user_id: User identifier.
+    - user_ids: User identifiers.
 
     Exceptions:
     - HTTP 500: In case of database error.
 
     Returns:
-    - A list of movie IDs watched by the user.
+    - A dictionary mapping each user ID to the list of movie IDs they watched.
     """
     try:
-        history = db.query(MovieUserRating.movieId).filter(
-            MovieUserRating.userId == user_id).all()
-        return [row.movieId for row in history]
+        history = (await db.execute(
+            select(MovieUserRating.userId, MovieUserRating.movieId).where(
+                MovieUserRating.userId.in_(user_ids)))).all()
+        histories = {user_id: [] for user_id in user_ids}
+        for row in history:
+            histories[row.userId].append(row.movieId)
+        return histories
     except SQLAlchemyError:
         raise HTTPException(status_code=500,
                             detail="Error fetching user history")
 
 
-def update_failed_insert(db: Session, failed_insert: dict) -> list:
+async def add_movies_to_user(db: AsyncSession, user_id: int, movies: List[MovieSchema]) -> Dict[str, int]:
     """
-    Updates movie records that failed to insert initially.
+    Adds movies to a user's viewing history.
 
-    This function attempts to update the failed records in the database.
-    If successful, the record is updated with the new rating and timestamp.
-    If it fails, the record is added to a list of failed updates.
+    All ratings are written, and the user's features updated, by a single
+    statement (see rate_movies_statement) in one transaction, once the user
+    is locked (see lock_user_statement): new movies are inserted, movies
+    already in the history get their rating and timestamp updated. Unknown
+    movie IDs (and unknown users) are skipped by the statement itself. The user's cached recommendations are invalidated.
 
     Arguments:
-    - db: Active database session.
-    - failed_insert: Dictionary containing the information of movies and users for which insertion failed.
+    - db: Database session.
+    - user_id: User identifier.
+    - movies: List of movies with their ratings.
+
+    Exceptions:
+    - HTTP 500: In case of database error.
 
     Returns:
-    - failed_updates: List of records that could not be updated.
+    - A dictionary with the number of "inserted" and "updated" movies.
+    """
+    new_ratings = ratings_values(movies)
+    if new_ratings is None:
+        return {"inserted": 0, "updated": 0}
 
-    Exceptions:
-    - SQLAlchemyError: If a SQLAlchemy error occurs during the update.
-    """
-    failed_updates = []
-    for obj in failed_insert:
-        user_id = obj["userId"]
-        movie_id = obj["movieId"]
-        rating = obj["rating"]
-        timestamp = obj["timestamp"]
-        try:
-            db.query(MovieUserRating).filter_by(userId=user_id, movieId=movie_id).update({
-                'rating': rating,
-                'timestamp': timestamp
-            })
-            db.commit()
-        except SQLAlchemyError:
-            db.rollback()
-            failed_updates.append(obj)
-    return failed_updates
+    try:
+        await db.execute(lock_user_statement(user_id))
+        row = (await db.execute(rate_movies_statement(user_id, new_ratings))).first()
+        await db.commit()
+    except SQLAlchemyError as e:
+        await db.rollback()
+        dead_letter_ratings(user_id, movies, e)
+        raise HTTPException(
+            status_code=500, detail="Error adding movies to user history")
+    finally:
+        # New ratings change the user's features and history
+        USER_RESULTS.pop(user_id)
+
+    if row is None:
+        return {"inserted": 0, "updated": 0}
+    return {"inserted": row.inserted, "updated": row.written - row.inserted}
 
 
-def add_movies_to_user(db: Session, user_id: int, movies: List[MovieSchema]) -> int:
+async def get_users_features(db: AsyncSession, user_ids: List[int]) -> "pd.DataFrame":
     """
-    Adds movies to a user's viewing history.
+    Fetches the genre feature rows of several users in one query.
 
     Arguments:
     - db: Database session.
-    - user_id: User identifier.
-    - movies: List of movies with their ratings.
+    - user_ids: User identifiers.
+
+    Returns:
+    - A DataFrame indexed by userId with one column per genre, in GENRES
+      (table) order. Unknown users are missing from the index.
+    """
+    result = await db.execute(
+        select(*User.__table__.columns).where(User.userId.in_(user_ids)))
+    return features_frame(result.all())
 
-    Exceptions:
-    - HTTP 500: In case of database error.
+
+async def get_user_features(db: AsyncSession, user_id: int) -> Optional[np.ndarray]:
+    """
+    Fetches the genre features of a user.
 
     Returns:
-    - The number of new movies added.
+    - The features in GENRES order (see features_vector), None if the user
+      doesn't exist.
     """
-    counter_new_movies = 0
-    failed_insert = []
-    failed_updates = []
+    row = (await db.execute(select(*User.__table__.columns)
+                            .where(User.userId == user_id))).first()
+    return None if row is None else features_vector(row)
 
-    for movie in movies:
-        movie_id = movie.moviesId
-        rating = max(0, min(5, movie.rating))
-        try:
-            data_movie_user_rating = {
-                "userId": user_id,
-                "movieId": movie_id,
-                "rating": rating,
-                "timestamp": pd.Timestamp.now().round(freq='s')
-            }
-            new_rating = MovieUserRating(**data_movie_user_rating)
-            db.add(new_rating)
-            db.commit()
-            counter_new_movies += 1
-
-        except IntegrityError as e:
-            db.rollback()
-            if "unique constraint" in str(e.orig):
-                failed_insert.append(data_movie_user_rating)
-            elif "foreign key constraint" in str(e.orig):
-                print(
-                    f"Foreign key error: the movie {movie_id} or user {user_id} does not exist.")
-            else:
-                print(f"Integrity error: {str(e.orig)}")
-
-        except SQLAlchemyError:
-            db.rollback()
-            raise HTTPException(
-                status_code=500, detail="Error adding movies to user history")
 
-    failed_updates = update_failed_insert(db, failed_insert)
+def model_features(model, X: np.ndarray, columns: Sequence[str]) -> np.ndarray:
+    """
+    Reorders the columns of X (genres named by columns) in the feature
+    order the model was fitted with.
+    """
+    position = {genre: i for i, genre in enumerate(columns)}
+    return X[:, [position[name] for name in model.feature_names_in_]]
 
-    if failed_updates:
-        df = pd.DataFrame(failed_updates)
-        df.to_csv(
-            f'failed_movie_updates_{str(int(datetime.now().timestamp()))}.csv', index=False)
-        print("Failed update data saved in 'failed_movie_updates.csv'.")
 
-    return counter_new_movies
+def order_columns(indices: np.ndarray) -> np.ndarray:
+    """
+    Returns, for each row of a model result, the indices of columns by
+    decreasing value (the values of a row are distinct).
+    """
+    return np.argsort(-np.asarray(indices), axis=1, kind="stable")
 
 
-def set_new_features(db: Session, user_id: int) -> None:
+def genre_order(loaded: LoadedModel, role: str, X: np.ndarray,
+                columns: Sequence[str]) -> np.ndarray:
     """
-    Updates a user's features (movie genres) based on their viewing history.
+    Queries a model and returns, for each row of X, the indices of columns
+    by decreasing model value. The model call is timed by version and role.
+    """
+    start = time.perf_counter()
+    _, indices = loaded.model.kneighbors(model_features(loaded.model, X, columns))
+    MODEL_INFERENCE_DURATION.labels(version=loaded.version, role=role)\
+        .observe(time.perf_counter() - start)
+    return order_columns(indices)
 
-    Arguments:
-    - db: Database session.
-    - user_id: User identifier.
 
-    Exceptions:
-    - HTTP 500: In case of database error.
+def compare_shadow(loaded: LoadedModel, X: np.ndarray, columns: Sequence[str],
+                   served: List[List[int]]) -> None:
+    """
+    Queries the shadow model and counts, for each row of X, whether its
+    three best genres are the ones of the served model. Runs in
+    SHADOW_EXECUTOR.
     """
     try:
-        result = (
-            db.query(User.userId, Movie.genres)
-            .join(MovieUserRating, MovieUserRating.movieId == Movie.movieId)
-            .filter(MovieUserRating.userId == user_id)
-            .all()
-        )
+        top = genre_order(loaded, "shadow", X, columns)[:, :3].tolist()
+        for shadow_top, served_top in zip(top, served):
+            result = "agree" if set(shadow_top) == set(served_top) else "disagree"
+            MODEL_AGREEMENT.labels(version=loaded.version, result=result).inc()
+    except Exception:
+        print(f"Shadow model {loaded.version} failed:", traceback.format_exc(limit=3))
+    finally:
+        SHADOW_SLOTS.release()
 
-        df = pd.DataFrame(result, columns=["userId", "genres"])
-        df = pd.concat(
-            [df["userId"], df["genres"].str.get_dummies(sep="|")], axis=1)
-        user_vector = df.groupby("userId").mean()
 
-        user_features = user_vector.to_dict(orient="index").get(user_id, {})
-        if user_features:
-            db.query(User).filter(User.userId == user_id).update(user_features)
-            db.commit()
+def run_shadow(X: np.ndarray, columns: Sequence[str], order: np.ndarray) -> None:
+    """
+    Submits the shadow model call of a ranking to SHADOW_EXECUTOR without
+    waiting for it (nothing to do without a shadow model).
+    """
+    loaded = SHADOW_STORE.current
+    if loaded is None:
+        return
+    if not SHADOW_SLOTS.acquire(blocking=False):
+        SHADOW_SKIPPED.inc()
+        return
+    SHADOW_EXECUTOR.submit(compare_shadow, loaded, X, columns, order[:, :3].tolist())
+
 
-    except SQLAlchemyError:
-        db.rollback()
-        raise HTTPException(
-            status_code=500, detail="Error setting new features to user")
+def sample_genres(order: np.ndarray, columns: Sequence[str]) -> List[List[str]]:
+    """
+    Puts first, in each row of a genre_order result, one genre sampled
+    among the three best ranked, and returns the rows as genre names.
+    """
+    chosen = order[np.arange(len(order)),
+                   RNG.integers(0, min(3, order.shape[1]), size=len(order))]
+    return [[columns[c]] + [columns[j] for j in row if j != c]
+            for row, c in zip(order.tolist(), chosen.tolist())]
 
 
-def recommend_movie(db: Session, seen_movies: List[int], user_id: int) -> Dict:
+# Model calls of the recommendation routes run on INFERENCE_EXECUTOR
+# workers ("thread", "process" or "inline" on the event loop), started by
+# the app lifespan
+INFERENCE_POOL = InferencePool(
+    os.environ.get("INFERENCE_EXECUTOR", "thread"),
+    workers=int(os.environ.get("INFERENCE_WORKERS", min(4, os.cpu_count() or 1))))
+
+
+async def pooled_genre_order(loaded: LoadedModel, role: str, X: np.ndarray,
+                             columns: Sequence[str]) -> np.ndarray:
+    """
+    genre_order on INFERENCE_POOL, the shadow model (if any) ranking the
+    same rows in the background (see run_shadow).
+    """
+    duration, indices = await INFERENCE_POOL.kneighbors(
+        loaded, model_features(loaded.model, X, columns))
+    MODEL_INFERENCE_DURATION.labels(version=loaded.version, role=role).observe(duration)
+    order = order_columns(indices)
+    run_shadow(X, columns, order)
+    return order
+
+
+async def rank_genres(X: np.ndarray, columns: Sequence[str] = GENRES,
+                      user_id: Optional[int] = None) -> List[List[str]]:
     """
-    Recommends a new movie to a user, avoiding already watched films.
+    Ranks the genres to recommend to each user with a single model call.
+
+    The model is queried once on the stacked feature matrix, on
+    INFERENCE_POOL. For each user, one genre is sampled among the three
+    best ranked by the model and put first, the other genres follow in
+    model order.
+
+    Arguments:
+    - X: Feature rows (one per user, or a single vector).
+    - columns: Genre of each column of X, GENRES by default.
+    - user_id: The ID of the user of a single vector, to route them to the
+      canary (see select_model). Without it the primary model is used.
+
+    Returns:
+    - One list of genre column names per row of X.
+    """
+    role, loaded = select_model(user_id)
+    order = await pooled_genre_order(loaded, role, np.atleast_2d(X), columns)
+    return sample_genres(order, columns)
+
+
+async def batch_genre_order(key: Tuple[str, LoadedModel], X: np.ndarray) -> np.ndarray:
+    """
+    Ranks the GENRES columns of the rows coalesced by MODEL_BATCHER for one
+    model (key is its role and the loaded model).
+    """
+    role, loaded = key
+    return await pooled_genre_order(loaded, role, X, GENRES)
+
+
+# Concurrent single-user requests are ranked by one model call: rows wait
+# up to MODEL_BATCH_WAIT_US microseconds for MODEL_BATCH_SIZE rows of the
+# same model (MODEL_BATCH_SIZE=1 disables the batching)
+MODEL_BATCHER = MicroBatcher(
+    batch_genre_order,
+    max_rows=int(os.environ.get("MODEL_BATCH_SIZE", 32)),
+    max_wait=float(os.environ.get("MODEL_BATCH_WAIT_US", 500)) / 1e6)
+
+
+async def rank_user_genres(features: np.ndarray, user_id: int) -> List[str]:
+    """
+    Ranks the genres to recommend to one user, like rank_genres, the model
+    call being shared with the concurrent requests (see MODEL_BATCHER).
+
+    Arguments:
+    - features: The user's genre features, in GENRES order.
+    - user_id: The ID of the user.
+
+    Returns:
+    - The genre column names, the recommended genre first.
+    """
+    role, loaded = select_model(user_id)
+    order = await MODEL_BATCHER.call((role, loaded), features)
+    return sample_genres(order[np.newaxis], GENRES)[0]
+
+
+async def choose_genres(users: "pd.DataFrame") -> "pd.Series":
+    """
+    Chooses the genre to recommend to each user with a single model call
+    (see rank_genres).
+
+    Arguments:
+    - users: Feature rows, as returned by get_users_features.
+
+    Returns:
+    - A Series indexed by userId containing the chosen genre column name.
+    """
+    import pandas as pd
+    ranked = await rank_genres(users.to_numpy(dtype=np.float64), list(users.columns))
+    return pd.Series([genres[0] for genres in ranked], index=users.index, dtype=object)
+
+
+async def similar_users_movies(db: AsyncSession, user_id: int, features: np.ndarray, k: int) -> List[int]:
+    """
+    Finds the movies best rated by the users most similar to a user.
+
+    Similar users come from the IVF user index of the model artifact. Their
+    ratings are aggregated in the database, movies already in the user's
+    history being excluded by a NOT EXISTS anti-join.
+
+    Arguments:
+    - db: Database session.
+    - user_id: The ID of the user.
+    - features: The user's genre features, in GENRES order.
+    - k: Maximum number of movies.
+
+    Returns:
+    - Movie IDs, best mean rating first (then most rated, then movieId).
+      Empty if the model has no user index.
+    """
+    index = getattr(serving_model(user_id), "user_index", None)
+    if index is None:
+        return []
+    position = {genre: i for i, genre in enumerate(GENRES)}
+    x = np.array([features[position[name]] if name in position else 0.
+                  for name in index.feature_names])
+    similar_users = index.query(np.nan_to_num(x), N_SIMILAR_USERS, exclude=user_id)
+    if not similar_users:
+        return []
+
+    seen = aliased(MovieUserRating)
+    stmt = select(MovieUserRating.movieId).where(
+        MovieUserRating.userId.in_(similar_users),
+        MovieUserRating.rating.is_not(None),
+        ~select(seen.movieId).where(
+            seen.userId == user_id, seen.movieId == MovieUserRating.movieId
+        ).exists()
+    ).group_by(MovieUserRating.movieId).order_by(
+        func.avg(MovieUserRating.rating).desc(),
+        func.count(MovieUserRating.rating).desc(),
+        MovieUserRating.movieId
+    ).limit(k)
+    return list((await db.execute(stmt)).scalars())
+
+
+async def unseen_movies(db: AsyncSession, user_id: int, candidates: np.ndarray, k: int) -> List[int]:
+    """
+    Keeps the first k candidates the user has not seen yet.
+
+    The user's history never leaves the database: candidates are sent by
+    chunks as one int[] parameter, and
+    unnest(:candidates) WITH ORDINALITY ... WHERE NOT EXISTS (history row)
+    returns the unseen ones in order. The chunk grows 4x at each round, so
+    heavy users who saw the top candidates need a few round trips, not a
+    transfer of their whole history.
+
+    Arguments:
+    - db: Database session.
+    - user_id: The ID of the user.
+    - candidates: Movie IDs, best ranked first.
+    - k: Maximum number of movies to keep.
+
+    Returns:
+    - Up to k unseen movie IDs, in candidates order.
+    """
+    chunk = bindparam("candidates", type_=ARRAY(Integer))
+    ranked = func.unnest(chunk).table_valued("movieId", with_ordinality="ord")\
+        .render_derived(name="candidates")
+    stmt = select(ranked.c.movieId).where(
+        ~select(MovieUserRating.movieId).where(
+            MovieUserRating.userId == user_id,
+            MovieUserRating.movieId == ranked.c.movieId
+        ).exists()
+    ).order_by(ranked.c.ord)
+
+    unseen, offset, size = [], 0, max(UNSEEN_CHUNK_SIZE, 2 * k)
+    while len(unseen) < k and offset < len(candidates):
+        ids = [int(m) for m in candidates[offset:offset + size]]
+        unseen += list((await db.execute(stmt, {"candidates": ids})).scalars())
+        offset, size = offset + size, size * 4
+    return unseen[:k]
+
+
+async def recommend_movies(db: AsyncSession, user_id: int, k: int,
+                           strategy: str = "genre", features: Optional[np.ndarray] = None) -> List[Dict]:
+    """
+    Recommends a ranked list of new movies to a user, avoiding already
+    watched films (excluded in the database, see unseen_movies).
+
+    With the "genre" strategy, the list starts with the movies of the chosen
+    genre and goes on with the next genres ranked by the model. With the
+    "similar_users" strategy, it starts with the movies best rated by
+    similar users (see similar_users_movies) and is completed by genre.
 
     Arguments:
     - db: Database session.
-    - seen_movies: List of movie IDs already watched.
     - user_id: The ID of the user.
+    - k: Maximum number of movies to recommend.
+    - strategy: "genre" or "similar_users".
+    - features: The user's features when the caller already has them
+      (see features_vector), else they are fetched.
 
     Exceptions:
     - HTTP 404: If no new movies are available for recommendation.
     - HTTP 500: In case of a database error.
 
     Returns:
-    - A dictionary containing the movie ID and title of the recommended movie.
+    - A list of dictionaries containing the movie ID and title of the
+      recommended movies, best ranked first.
     """
     try:
-        users = pd.read_sql(
-            db.query(User).filter(User.userId == user_id).statement,
-            db.bind
-        ).drop(["userId", "count_movies"], axis=1)
-        _, indices = MODEL.kneighbors(users[MODEL.feature_names_in_])
-        movies_reco_vec = pd.DataFrame(indices, columns=users.columns)
-        genre_to_reco = movies_reco_vec.loc[0]\
-            .sort_values(ascending=False)[:3].sample()\
-            .index.to_list()[:1]
-        regex_reco = "|".join(genre_to_reco) + "%"
-
-        movie = db.query(Movie)\
-            .filter(~Movie.movieId.in_(seen_movies))\
-            .filter(Movie.genres.like(regex_reco))\
-            .first()
-        if movie:
-            return {"movieId": movie.movieId, "title": movie.title}
+        if features is None:
+            with observe_stage("features"):
+                features = await get_user_features(db, user_id)
+            if features is None:
+                raise HTTPException(status_code=400, detail="User doesn't exist")
+        with observe_stage("model"):
+            genres = await rank_user_genres(features, user_id)
+        catalog = await get_catalog(db)
+
+        movies = []
+        if strategy == "similar_users":
+            with observe_stage("similar_users"):
+                movies = catalog.describe(await similar_users_movies(
+                    db, user_id, features, k))
+        if len(movies) < k:
+            with observe_stage("candidates"):
+                candidates = catalog.ranked_ids(genres)
+                candidates = candidates[
+                    ~np.isin(candidates, [m["movieId"] for m in movies])]
+                movies += catalog.describe(await unseen_movies(
+                    db, user_id, candidates, k - len(movies)))
+        if movies:
+            return movies
         else:
             raise HTTPException(
                 status_code=404, detail="No new movies to recommend"
@@ -313,44 +900,230 @@ def recommend_movie(db: Session, seen_movies: List[int], user_id: int) -> Dict:
         raise HTTPException(status_code=500, detail="Error recommending movie")
 
 
-def save_recommendation(db: Session, output: Dict) -> bool:
+def cached_recommendations(user_id: int, k: int, strategy: str = "genre") -> Optional[Tuple[List[Dict], int]]:
     """
-    Saves a movie recommendation to the database.
+    Takes the next recommendations of a user from USER_RESULTS.
+
+    The k first movies not served yet are marked as served, so that repeat
+    requests get new movies, as they would after a full computation.
+
+    Arguments:
+    - user_id: The ID of the user.
+    - k: Number of movies about to be served.
+    - strategy: Strategy the list must have been ranked with.
+
+    Returns:
+    - The user's ranked list and the offset of its first movie not served
+      yet, or None on a cache miss (no entry, expired, other strategy, or
+      fully served).
+    """
+    entry = USER_RESULTS.get(user_id)
+    if entry is None or entry["strategy"] != strategy \
+            or entry["offset"] >= len(entry["ranked"]):
+        RESULT_CACHE_REQUESTS.labels(result="miss").inc()
+        return None
+    RESULT_CACHE_REQUESTS.labels(result="hit").inc()
+    offset = entry["offset"]
+    entry["offset"] += k
+    return entry["ranked"], offset
+
+
+def paginate(user_id: int, ranked: List[Dict], k: int, cursor: Optional[str] = None,
+             offset: int = 0) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Slices a page out of a ranked list kept in RANKED_LISTS.
+
+    A cursor is "<token>.<offset>". RANKED_LISTS keeps one list per user,
+    with the token identifying it: pages of a list already stored (e.g. the
+    USER_RESULTS list of repeat requests) share its token, a new list
+    replaces it and invalidates the cursors of the previous one. Without
+    cursor, ranked is stored if pages are left after this one.
+
+    Arguments:
+    - user_id: The ID of the user.
+    - ranked: The ranked list (ignored when a cursor is given).
+    - k: Page size.
+    - cursor: Cursor returned by the previous page.
+    - offset: Position of the page in ranked (ignored with a cursor).
+
+    Exceptions:
+    - HTTP 400: If the cursor is unknown, expired or not the user's.
+
+    Returns:
+    - A tuple (page, next cursor or None).
+    """
+    entry = RANKED_LISTS.get(user_id)
+    if cursor is not None:
+        token, _, offset = cursor.partition(".")
+        if entry is None or entry[0] != token or not offset.isdigit() \
+                or int(offset) >= len(entry[1]):
+            raise HTTPException(
+                status_code=400, detail="Invalid or expired cursor")
+        ranked, offset = entry[1], int(offset)
+
+    page = ranked[offset:offset + k]
+    if offset + k >= len(ranked):
+        return page, None
+    if entry is not None and entry[1] is ranked:
+        token = entry[0]
+    else:
+        token = secrets.token_urlsafe(12)
+    if cursor is None:
+        # (Re)stored: the TTL runs from the last page served without cursor
+        RANKED_LISTS.set(user_id, (token, ranked))
+    return page, f"{token}.{offset + k}"
+
+
+async def save_recommendations(db: AsyncSession, outputs: List[Dict]) -> bool:
+    """
+    Saves several movie recommendations to the database in one commit.
+
+    While RECOMMENDATION_LOG is running, the rows are queued instead and
+    written in the background, and the session is left untouched.
 
     Args:
-        db (Session): SQLAlchemy database session used to perform operations.
-        output (Dict): Dictionary containing user data and the recommended movie.
-            - "userId" (int): The user ID.
-            - "recommendation" (dict): Contains recommendation information.
-                - "movieId" (int): The ID of the recommended movie.
+        db (AsyncSession): SQLAlchemy database session used to perform operations.
+        outputs (List[Dict]): Recommendations, each with "userId" (int) and
+            "recommendation" (dict with the "movieId" of the recommended movie).
 
     Returns:
-        bool: Returns True if the recommendation was successfully saved, or raises an exception in case of an error.
+        bool: True if the recommendations were successfully saved.
 
     Raises:
         HTTPException: Raises a 500 error if an SQLAlchemy error occurs during the saving process.
     """
+    timestamp = now_seconds()
+    rows = [
+        {"userId": output["userId"],
+         "movieId": output["recommendation"]["movieId"],
+         "rating": None, "timestamp": timestamp,
+         "is_recommended": True, "is_use_to_train": False}
+        for output in outputs
+    ]
+    if RECOMMENDATION_LOG.running:
+        await RECOMMENDATION_LOG.put(rows)
+        return True
+
     try:
-        new_rating = MovieUserRating(
-            userId=output["userId"],
-            movieId=output["recommendation"]["movieId"],
-            rating=None,
-            timestamp=pd.Timestamp.now().round(freq='s'),
-            is_recommended=True
-        )
-        db.add(new_rating)
-        db.commit()
+        db.add_all([MovieUserRating(**row) for row in rows])
+        await db.commit()
+        return True
     except SQLAlchemyError:
         raise HTTPException(
             status_code=500, detail="Error recording recommendation"
         )
 
 
+async def respond(db: AsyncSession, user_id: int, page: List[Dict],
+                  next_cursor: Optional[str], wrote: bool = False) -> Dict:
+    """
+    Saves a page of recommendations and builds the response.
+
+    Arguments:
+    - db: Database session.
+    - user_id: The ID of the user.
+    - page: The recommended movies.
+    - next_cursor: Cursor of the next page, or None.
+    - wrote: Whether the request wrote to the session (user or ratings),
+      which must then be committed.
+
+    Returns:
+    - The ResponseRecommendationSchema dictionary.
+    """
+    if wrote and RECOMMENDATION_LOG.running:
+        # Before queuing: the log rows reference the user row, which the
+        # flusher's connection only sees once committed (otherwise
+        # committed by save_recommendations)
+        with observe_stage("commit"):
+            await db.commit()
+    with observe_stage("save"):
+        await save_recommendations(
+            db, [{"userId": user_id, "recommendation": movie} for movie in page])
+    return {"userId": user_id, "recommendation": page[0],
+            "recommendations": page, "next_cursor": next_cursor}
+
+
+def cached_page(user_id: Optional[int], movies: List[MovieSchema], k: int,
+                cursor: Optional[str], strategy: str) -> Optional[Tuple[List[Dict], Optional[str]]]:
+    """
+    Serves a page of an already ranked list: the cursor's list, or the
+    user's USER_RESULTS list for a repeat request without new ratings.
+
+    Exceptions:
+    - HTTP 400: If the cursor is unknown, expired or not the user's.
+
+    Returns:
+    - A tuple (page, next cursor or None), or None if the list must be
+      computed.
+    """
+    if cursor is not None:
+        served = paginate(user_id, [], k, cursor)
+        # The cached list does not know about this page
+        USER_RESULTS.pop(user_id)
+        return served
+    if user_id and len(movies) == 0:
+        cached = cached_recommendations(user_id, k, strategy)
+        if cached is not None:
+            ranked, offset = cached
+            return paginate(user_id, ranked, k, offset=offset)
+    return None
+
+
+async def upsert_user(db: AsyncSession, user_id: Optional[int], movies: List[MovieSchema]) -> Tuple[Any, bool]:
+    """
+    Creates the user with their ratings (userId null), or records the new
+    ratings of an existing user (after locking it), or only reads them, in
+    one statement returning the user's row with its features. Nothing is
+    committed.
+
+    Arguments:
+    - db: Database session.
+    - user_id: The ID of the user, None to create one.
+    - movies: The movies rated by the request.
+
+    Exceptions:
+    - HTTP 400: Missing movie history, or unknown user.
+    - SQLAlchemyError: In case of database error (failed ratings go to the
+      dead letter file).
+
+    Returns:
+    - The user row (userId and the features in GENRES order) and whether
+      the session was written to.
+    """
+    if not user_id and len(movies) == 0:
+        raise HTTPException(status_code=400, detail="Missing movie history")
+    new_ratings = ratings_values(movies)
+    with observe_stage("user"):
+        if not user_id:
+            row = (await db.execute(new_user_statement(new_ratings))).first()
+        elif new_ratings is not None:
+            USER_RESULTS.pop(user_id)
+            try:
+                await db.execute(lock_user_statement(user_id))
+                row = (await db.execute(rate_movies_statement(user_id, new_ratings))).first()
+            except SQLAlchemyError as e:
+                dead_letter_ratings(user_id, movies, e)
+                raise
+        else:
+            row = (await db.execute(select(*User.__table__.columns)
+                                    .where(User.userId == user_id))).first()
+    if row is None and not user_id:
+        raise HTTPException(
+            status_code=400, detail="Missing movie history (Movie IDs provided don't exist)"
+        )
+    if row is None:
+        raise HTTPException(status_code=400, detail="User doesn't exist")
+    return row, new_ratings is not None
+
+
 @reco_router.post("/recommendations", tags=["Recommendation"],
                   response_model=ResponseRecommendationSchema)
 async def post_recommendation(
     user: UserSchema, list_movie: ListMovieSchema,
-    db_engine: Session = Depends(get_db),
+    k: int = Query(1, ge=1, le=RANKED_LIST_SIZE),
+    cursor: Optional[str] = Query(None),
+    strategy: Literal["genre", "similar_users"] = Query("genre"),
+    db_engine: AsyncSession = Depends(get_async_db),
     current_client: str = Depends(get_current_user)
 ) -> Dict:
     """
@@ -366,6 +1139,10 @@ async def post_recommendation(
             - **moviesId** (integer): The ID of the watched movie. Id is based on our list, see: [List of moviesId](https://github.com/universmotion/mai24_cmlops_film/blob/master/data/external/movies.csv)
             - **rating** (integer): The user's rating for the movie.
 
+    - **k** (query, 1 to 100, default 1): Number of movies to recommend.
+    - **cursor** (query): The **next_cursor** of the previous response, to get the next page of the same ranked list.
+    - **strategy** (query, default **genre**): **genre** recommends movies of the genres chosen by the model; **similar_users** first recommends the movies best rated by the most similar users, then completes by genre.
+
     ### Example Requests
 
     1. **New User with Watch History**
@@ -397,8 +1174,20 @@ async def post_recommendation(
     }
     ```
 
+    3. **Next Page of a Shelf** (`POST /recommendations?k=20&cursor=...`)
+    ```json
+    {
+        "user": {
+            "userId": 138479
+            },
+            "list_movie": {
+                "listMovie": []
+        }
+    }
+    ```
+
     - **Errors**:
-        - HTTP 400: Missing user or movie history.
+        - HTTP 400: Missing user or movie history, invalid or expired cursor.
         - HTTP 422: Validation Error (of json).
         - HTTP 500: Internal database error.
 
@@ -406,39 +1195,176 @@ async def post_recommendation(
 
     - **New user**: When **userId** is **null** and there is at least one movie in the **listMovie**, a user is created and a recommendation is returned.
     - **Existing user**: If **userId** exists, recommendations can be made based on the user's past history or a new set of watched movies.
+    - **Pages**: The ranked list (up to 100 movies) is computed once, by the request without cursor, and kept 10 minutes. Requests with a cursor are served from it and must send the same **userId**; their **listMovie** is ignored. Only the cursors of the user's last ranked list are valid: a new list (e.g. after new ratings) invalidates the previous ones.
+    - **Repeat requests**: The ranked list of a user is also cached for 5 minutes; requests with the same **userId** and an empty **listMovie** are served the next movies of it. Sending new ratings invalidates it.
+    - **Duplicates**: Identical requests of a user (same body and query) sent while one of them is processed get its response, instead of being processed again.
+    """
+    if not user.userId:
+        # Every request of a new user creates one
+        return await recommend_request(user, list_movie, k, cursor, strategy, db_engine)
+    key = (user.userId, k, cursor, strategy,
+           tuple((movie.moviesId, movie.rating) for movie in list_movie.listMovie))
+    return await IN_FLIGHT.do(key, lambda: recommend_request(
+        user, list_movie, k, cursor, strategy, db_engine))
+
+
+async def recommend_request(user: UserSchema, list_movie: ListMovieSchema, k: int,
+                            cursor: Optional[str], strategy: str,
+                            connection: AsyncSession) -> Dict:
+    """
+    Serves a POST /recommendations request (see post_recommendation).
+
+    Exceptions:
+    - HTTP 400: Missing user or movie history, invalid or expired cursor.
+    - HTTP 404: If no new movies are available for recommendation.
+    - HTTP 500: In case of a database error.
+
+    Returns:
+    - The userId, the first recommended movie, the page and its next_cursor.
     """
     try:
-        is_new_user = False
-        connection = db_engine
-        if not user.userId and len(list_movie.listMovie) == 0:
-            raise HTTPException(
-                status_code=400, detail="Missing movie history"
-            )
-        elif not user.userId:
-            user_id = create_user(connection)
-            is_new_user = True
-        elif connection.query(User).filter(User.userId == user.userId).first() is not None:
-            user_id = user.userId
-        else:
-            raise HTTPException(status_code=400, detail="User doesn't exist")
+        served = cached_page(user.userId, list_movie.listMovie, k, cursor, strategy)
+        if served is not None:
+            return await respond(connection, user.userId, *served)
+
+        # One transaction: the user row (written and/or read with its
+        # features), the unseen candidates, one commit if anything was
+        # written (the recommendations themselves go to RECOMMENDATION_LOG)
+        row, wrote = await upsert_user(connection, user.userId, list_movie.listMovie)
+        user_id = row.userId
+        try:
+            ranked = await recommend_movies(
+                connection, user_id, RANKED_LIST_SIZE, strategy, features_vector(row))
+        except HTTPException:
+            # Nothing to recommend: the ratings are still recorded
+            await connection.commit()
+            raise
+        USER_RESULTS.set(
+            user_id, {"ranked": ranked, "offset": k, "strategy": strategy})
+        page, next_cursor = paginate(user_id, ranked, k)
+        return await respond(connection, user_id, page, next_cursor, wrote=wrote)
 
-        if len(list_movie.listMovie) > 0:
-            count_new_movies_added = add_movies_to_user(
-                connection, user_id, list_movie.listMovie
-            )
-        else:
-            count_new_movies_added = 0
+    except SQLAlchemyError:
+        raise HTTPException(status_code=500, detail="Database error")
 
-        if count_new_movies_added == 0 and is_new_user:
-            raise HTTPException(
-                status_code=400, detail="Missing movie history (Movie IDs provided don't exist)"
-            )
 
-        seen_movies = get_user_history(connection, user_id)
-        recommendation = recommend_movie(connection, seen_movies, user_id)
-        output = {"userId": user_id, "recommendation": recommendation}
-        save_recommendation(connection, output)
-        return output
+async def prepare_batch_user(db: AsyncSession, user: BatchUserSchema) -> Dict:
+    """
+    Creates a user of a batch (userId null) or records their new ratings.
+
+    Exceptions:
+    - HTTP 500: In case of database error.
+
+    Returns:
+    - The user's BatchItemRecommendationSchema dictionary, without
+      recommendation yet ("detail" set if the user cannot get one).
+    """
+    list_movie = user.listMovie or []
+    item = {"userId": user.userId, "recommendation": None, "detail": None}
+    if not user.userId and len(list_movie) == 0:
+        item["detail"] = "Missing movie history"
+    elif not user.userId:
+        try:
+            with observe_stage("create_user"):
+                item["userId"], _ = await create_user_with_movies(db, list_movie)
+        except HTTPException as e:
+            if e.status_code != 400:
+                raise
+            item["detail"] = e.detail
+    elif len(list_movie) > 0:
+        with observe_stage("add_movies"):
+            await add_movies_to_user(db, user.userId, list_movie)
+    return item
+
+
+def pick_batch_movie(item: Dict, genres: "pd.Series", histories: Dict[int, List[int]],
+                     catalog) -> bool:
+    """
+    Sets the recommendation (or the error detail) of a user of a batch.
+
+    Arguments:
+    - item: The user's dictionary, see prepare_batch_user.
+    - genres: The genre chosen for each user, see choose_genres.
+    - histories: The movies seen by each user, the recommended movie is
+      appended (a user listed twice gets two different movies).
+    - catalog: The movies catalog.
+
+    Returns:
+    - True if a movie was recommended.
+    """
+    if item["detail"] is not None:
+        return False
+    if item["userId"] not in genres.index:
+        item["detail"] = "User doesn't exist"
+        return False
+    movies = catalog.pick(genres.loc[item["userId"]], histories[item["userId"]])
+    if not movies:
+        item["detail"] = "No new movies to recommend"
+        return False
+    item["recommendation"] = movies[0]
+    histories[item["userId"]].append(movies[0]["movieId"])
+    return True
+
+
+@reco_router.post("/recommendations/batch", tags=["Recommendation"],
+                  response_model=ResponseBatchRecommendationSchema)
+async def post_batch_recommendation(
+    batch: BatchRecommendationSchema,
+    db_engine: AsyncSession = Depends(get_async_db),
+    current_client: str = Depends(get_current_user)
+) -> Dict:
+    """
+    This request recommends a movie to each user of a batch, for example a whole cohort of users refreshing their home page.
+
+    Each user follows the same rules as **POST /recommendations**. Feature rows of all users are fetched in one query and scored with one model call.
+
+    ### Example Request
+
+    ```json
+    {
+        "users": [
+            {"userId": 138479, "listMovie": []},
+            {"userId": null, "listMovie": [{"moviesId": 1, "rating": 5}]}
+        ]
+    }
+    ```
+
+    - **Errors**:
+        - HTTP 400: Empty batch or more than 500 users.
+        - HTTP 422: Validation Error (of json).
+        - HTTP 500: Internal database error.
+
+    ### Key Conditions
+
+    - One item is returned per requested user, in request order.
+    - A user that cannot get a recommendation (unknown user, missing history, nothing left to recommend) gets a null **recommendation** and an error **detail**; the rest of the batch is still served.
+    """
+    if not 0 < len(batch.users) <= MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch must contain between 1 and {MAX_BATCH_SIZE} users"
+        )
+    import pandas as pd
+    try:
+        connection = db_engine
+        items = [await prepare_batch_user(connection, user) for user in batch.users]
+
+        user_ids = list({item["userId"] for item in items if item["detail"] is None})
+        with observe_stage("features"):
+            users = await get_users_features(connection, user_ids)
+        with observe_stage("model"):
+            genres = await choose_genres(users) if len(users) > 0 else pd.Series(dtype=object)
+        with observe_stage("history"):
+            histories = await get_users_history(connection, list(genres.index))
+        catalog = await get_catalog(connection)
+
+        outputs = [item for item in items
+                   if pick_batch_movie(item, genres, histories, catalog)]
+
+        if outputs:
+            with observe_stage("save"):
+                await save_recommendations(connection, outputs)
+        return {"recommendations": items}
 
     except SQLAlchemyError:
         raise HTTPException(status_code=500, detail="Database error")
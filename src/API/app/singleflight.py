@@ -0,0 +1,60 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from metrics import COALESCED_REQUESTS
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Shares one in-flight computation among concurrent identical calls.
+
+    The first call of a key runs the computation, the calls of the same
+    key made meanwhile wait for it and get its result (or its exception).
+    Once it is done, the next call of the key runs it again: nothing is
+    cached. If the first caller is cancelled, a waiting one takes over.
+    Must be used from a single event loop.
+
+    Attributes:
+    - name: Label of the coalesced calls counter.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Returns the result of fn(), shared with the concurrent calls of key.
+        """
+        while key in self._calls:
+            future = self._calls[key]
+            COALESCED_REQUESTS.labels(name=self.name).inc()
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    # This caller was cancelled, not the running call
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Retrieved: no "never retrieved" warning without waiting calls
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
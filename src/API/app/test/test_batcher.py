@@ -0,0 +1,58 @@
+import conftest
+import asyncio
+import numpy as np
+import pytest
+from batcher import MicroBatcher
+
+
+class Recorder:
+    """
+    Vectorized function recording the shape of each call.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, key, X):
+        self.calls.append((key, X.shape[0]))
+        return X * 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_are_coalesced():
+    fn = Recorder()
+    batcher = MicroBatcher(fn, max_rows=8, max_wait=0.01)
+    results = await asyncio.gather(
+        *[batcher.call("m", np.array([i, i + 1.])) for i in range(5)])
+    assert fn.calls == [("m", 5)]
+    # Each caller gets its own row
+    assert [r.tolist() for r in results] == [[2 * i, 2 * i + 2] for i in range(5)]
+
+
+@pytest.mark.asyncio
+async def test_batches_by_size_and_key():
+    fn = Recorder()
+    batcher = MicroBatcher(fn, max_rows=2, max_wait=10)
+    await asyncio.gather(*[batcher.call("a", np.zeros(2)) for _ in range(4)],
+                         *[batcher.call("b", np.zeros(2)) for _ in range(2)])
+    # max_rows rows flush at once, without waiting max_wait
+    assert sorted(fn.calls) == [("a", 2), ("a", 2), ("b", 2)]
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_caller():
+    async def fail(key, X):
+        raise ValueError("bad model")
+
+    batcher = MicroBatcher(fail, max_rows=4, max_wait=0.001)
+    results = await asyncio.gather(*[batcher.call("m", np.zeros(2)) for _ in range(3)],
+                                   return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+@pytest.mark.asyncio
+async def test_without_batching():
+    fn = Recorder()
+    batcher = MicroBatcher(fn, max_rows=1)
+    await asyncio.gather(*[batcher.call("m", np.zeros(2)) for _ in range(3)])
+    assert fn.calls == [("m", 1)] * 3
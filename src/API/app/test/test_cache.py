@@ -0,0 +1,41 @@
+import conftest
+from cache import TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_expiry():
+    clock = Clock()
+    cache = TTLCache(maxsize=10, ttl=5, timer=clock)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    clock.now = 5
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_lru_eviction():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # "a" becomes the most recently used, "b" is evicted
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_pop_and_clear():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    assert cache.pop("a") == 1
+    assert cache.pop("a", "missing") == "missing"
+    cache.set("b", 2)
+    cache.clear()
+    assert len(cache) == 0
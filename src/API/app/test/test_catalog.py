@@ -0,0 +1,85 @@
+import conftest
+import numpy as np
+import pytest
+from unittest.mock import MagicMock
+from sqlalchemy.ext.asyncio import AsyncSession
+import catalog
+from catalog import CatalogIndex, GENRES, normalize_genre, get_catalog
+
+ROWS = [
+    (3, "Grumpier Old Men (1995)", "Comedy|Romance"),
+    (1, "Toy Story (1995)", "Adventure|Animation|Children|Comedy|Fantasy"),
+    (2, "Jumanji (1995)", "Adventure|Children|Fantasy"),
+    (4, "Alien (1979)", "Horror|Sci-Fi"),
+    (5, "Unknown", "(no genres listed)"),
+]
+
+
+@pytest.fixture
+def index():
+    return CatalogIndex(ROWS)
+
+
+def test_normalize_genre():
+    assert normalize_genre("Sci-Fi") == "Sci_Fi"
+    assert normalize_genre("Film-Noir") == "Film_Noir"
+    assert normalize_genre("(no genres listed)") == "no_genres_listed"
+
+
+def test_index_arrays(index):
+    assert list(index.movie_ids) == [1, 2, 3, 4, 5]
+    assert index.titles[0] == "Toy Story (1995)"
+    assert len(index) == 5
+    assert 4 in index and 42 not in index
+    mask = int(index.genre_masks[3])
+    assert mask == (1 << GENRES.index("Horror")) | (1 << GENRES.index("Sci_Fi"))
+
+
+def test_postings_use_first_genre(index):
+    assert list(index.movie_ids[index.postings["Adventure"]]) == [1, 2]
+    assert list(index.movie_ids[index.postings["Comedy"]]) == [3]
+    assert list(index.movie_ids[index.postings["no_genres_listed"]]) == [5]
+    assert len(index.postings["Sci_Fi"]) == 0
+
+
+def test_pick_skips_seen_movies(index):
+    assert index.pick("Adventure", []) == [
+        {"movieId": 1, "title": "Toy Story (1995)"}]
+    assert index.pick("Adventure", [1]) == [
+        {"movieId": 2, "title": "Jumanji (1995)"}]
+    assert index.pick("Adventure", [1, 2]) == []
+    assert index.pick("Sci_Fi", []) == []
+    assert [m["movieId"] for m in index.pick("Adventure", [], k=5)] == [1, 2]
+
+
+def test_rank_by_popularity(monkeypatch):
+    index = CatalogIndex(ROWS + [(6, "Heat (1995)", "Action|Crime|Thriller"),
+                                 (7, "Sabrina (1995)", "Comedy|Romance")])
+    monkeypatch.setattr(catalog, "CATALOG", index)
+    assert [m["movieId"] for m in index.pick("Comedy", [], k=5)] == [3, 7]
+
+    # 42 is not in the catalog anymore, 3 was added after training
+    catalog.set_popularity({"Comedy": np.array([7, 42]), "Adventure": np.array([2, 1])})
+    assert [m["movieId"] for m in index.pick("Comedy", [], k=5)] == [7, 3]
+    assert [m["movieId"] for m in index.pick("Adventure", [2], k=5)] == [1]
+    assert [m["movieId"] for m in index.pick("Action", [], k=5)] == [6]
+
+    catalog.set_popularity(None)
+    assert [m["movieId"] for m in index.pick("Comedy", [], k=5)] == [3, 7]
+
+
+def test_ranked_ids(index):
+    assert index.ranked_ids(["Adventure", "Horror", "Unknown"]).tolist() == [1, 2, 4]
+    assert index.ranked_ids([]).tolist() == []
+
+
+@pytest.mark.asyncio
+async def test_get_catalog_loads_once(monkeypatch):
+    monkeypatch.setattr(catalog, "CATALOG", None)
+    db = MagicMock(spec=AsyncSession)
+    db.execute.return_value = MagicMock()
+    db.execute.return_value.all.return_value = ROWS
+    first = await get_catalog(db)
+    assert len(first) == 5
+    assert await get_catalog(db) is first
+    db.execute.assert_awaited_once()
@@ -1,10 +1,13 @@
 import conftest
 import os
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import Session
 from unittest.mock import patch
-from db_manager import get_db, SessionLocal
+from db_manager import get_db, SessionLocal, get_async_db, AsyncSessionLocal
+from db_manager import count_queries, count_query, async_engine
+from db_manager import engine as db_engine
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
 @pytest.fixture(autouse=True)
@@ -39,3 +42,33 @@ def test_get_db_session():
         with patch.object(db, "close") as mock_close:
             db_generator.close()
             mock_close.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_get_async_db_session():
+    db_generator = get_async_db()
+    db = await db_generator.__anext__()
+
+    assert isinstance(db, AsyncSession)
+
+    with patch.object(db, "close") as mock_close:
+        await db_generator.aclose()
+        mock_close.assert_awaited_once()
+
+
+def test_count_queries():
+    engine = create_engine("sqlite://")
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        with count_queries(engine) as statements:
+            conn.execute(text("SELECT 2"))
+            conn.execute(text("SELECT 3"))
+        conn.execute(text("SELECT 4"))
+    assert statements == ["SELECT 2", "SELECT 3"]
+    # Only listened to inside the block
+    assert not event.contains(engine, "before_cursor_execute", count_query)
+
+
+def test_engines_not_instrumented():
+    assert not event.contains(db_engine, "before_cursor_execute", count_query)
+    assert not event.contains(async_engine.sync_engine, "before_cursor_execute", count_query)
@@ -0,0 +1,91 @@
+import conftest
+import json
+import pytest
+from datetime import datetime
+from sqlalchemy.exc import SQLAlchemyError
+import db_manager
+import dead_letter
+from dead_letter import DeadLetterSink, read_dead_letters, FILE_NAME
+
+
+def test_put_flush_and_rotate(tmp_path):
+    sink = DeadLetterSink(tmp_path, max_bytes=200, backup_count=2)
+    sink.put("rating", [{"userId": 1, "movieId": 2, "rating": 4.0}], SQLAlchemyError("lost"))
+    assert not (tmp_path / FILE_NAME).exists()
+    assert sink.flush() == 1
+    record = json.loads((tmp_path / FILE_NAME).read_text())
+    assert record["kind"] == "rating" and record["row"]["movieId"] == 2
+    assert record["error"] == "SQLAlchemyError: lost"
+
+    for movie_id in range(3, 10):
+        sink.put("rating", [{"userId": 1, "movieId": movie_id, "rating": 4.0}] * 2,
+                 SQLAlchemyError("lost"))
+        sink.flush()
+    # Rotated at max_bytes, backup_count files kept
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        FILE_NAME, FILE_NAME + ".1", FILE_NAME + ".2"]
+
+
+def test_thread_writes_on_stop(tmp_path):
+    sink = DeadLetterSink(tmp_path, flush_interval=60)
+    sink.start()
+    sink.put("recommendation", [{"userId": 1, "movieId": 2}], OSError("full"))
+    sink.stop()
+    assert len((tmp_path / FILE_NAME).read_text().splitlines()) == 1
+
+
+def test_read_dead_letters_oldest_first(tmp_path):
+    sink = DeadLetterSink(tmp_path, max_bytes=1, backup_count=5)
+    for movie_id in [1, 2, 3]:
+        sink.put("rating", [{"userId": 1, "movieId": movie_id, "rating": 1.}], OSError())
+        sink.flush()
+    rows = read_dead_letters(tmp_path)
+    assert [row["movieId"] for row in rows["rating"]] == [1, 2, 3]
+    assert not (tmp_path / FILE_NAME).exists()
+
+
+class FakeSession:
+    def __init__(self, statements):
+        self.statements = statements
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, stmt):
+        if "UPDATE users" in str(stmt) and any(
+                "UPDATE users" in str(s) for s in self.statements):
+            raise SQLAlchemyError("lost again")
+        self.statements.append(stmt)
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_replay(tmp_path, monkeypatch):
+    statements = []
+
+    monkeypatch.setattr(db_manager, "AsyncSessionLocal", lambda: FakeSession(statements))
+    sink = DeadLetterSink(tmp_path)
+    sink.put("recommendation", [
+        {"userId": 1, "movieId": m, "rating": None, "is_recommended": True,
+         "timestamp": datetime(2024, 1, 1)} for m in [1, 2]], OSError())
+    sink.put("rating", [{"userId": 1, "movieId": 1, "rating": 4.}], OSError())
+    sink.put("rating", [{"userId": 2, "movieId": 2, "rating": 3.}], OSError())
+    sink.flush()
+
+    counts = await dead_letter.replay(tmp_path)
+    assert counts == {"replayed": 3, "failed": 1}
+    # One insert for the recommendations, then per user a lock and one
+    # statement (the second user's failed)
+    assert len(statements) == 4
+    assert "FOR UPDATE" in str(statements[1]) and "FOR UPDATE" in str(statements[3])
+    # The rating failing again is back in the dead letter file
+    rows = read_dead_letters(tmp_path)
+    assert rows == {"rating": [{"userId": 2, "movieId": 2, "rating": 3.}]}
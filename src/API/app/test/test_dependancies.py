@@ -8,10 +8,14 @@ from passlib.context import CryptContext
 from dependancies import (
     verify_password,
     get_password_hash,
+    verify_password_async,
+    get_password_hash_async,
     create_access_token,
     get_user,
     get_current_user,
-    authenticate_user
+    authenticate_user,
+    invalidate_client,
+    CLIENTS
 )
 from dependancies import SECRET_KEY, ALGORITHM
 from db_manager import Client
@@ -42,6 +46,26 @@ def test_get_password_hash():
     assert pwd_context.verify(password, hashed_password) == True
 
 
+@pytest.mark.asyncio
+async def test_password_functions_run_in_pool(monkeypatch):
+    import threading
+    import dependancies
+    threads = []
+    verify = dependancies.verify_password
+
+    def recording_verify(*args):
+        threads.append(threading.current_thread().name)
+        return verify(*args)
+
+    monkeypatch.setattr(dependancies, "verify_password", recording_verify)
+
+    hashed_password = await get_password_hash_async("testpassword")
+    assert pwd_context.verify("testpassword", hashed_password)
+    assert await verify_password_async("testpassword", hashed_password) is True
+    assert await verify_password_async("wrongpassword", hashed_password) is False
+    assert all(name.startswith("bcrypt") for name in threads) and len(threads) == 2
+
+
 def test_create_access_token():
     data = {"sub": "testuser"}
     expires_delta = timedelta(minutes=30)
@@ -72,6 +96,7 @@ async def test_get_current_user(db_session):
     user = get_current_user(token=token, db=db_session)
     assert user.username == "testuser"
 
+    invalidate_client("testuser")
     db_session.query().filter().first.return_value = None
     with pytest.raises(HTTPException) as excinfo:
         await get_current_user(token=token, db=db_session)
@@ -85,6 +110,22 @@ async def test_get_current_user(db_session):
     assert excinfo.value.detail == "Could not validate credentials"
 
 
+def test_get_current_user_cache(db_session):
+    CLIENTS.clear()
+    token = create_access_token({"sub": "cacheduser"})
+    db_session.query().filter().first.return_value = Client(username="cacheduser")
+
+    for _ in range(3):
+        user = get_current_user(token=token, db=db_session)
+        assert user.username == "cacheduser"
+    # Only the first request queries the database
+    assert db_session.query().filter().first.call_count == 1
+
+    invalidate_client("cacheduser")
+    get_current_user(token=token, db=db_session)
+    assert db_session.query().filter().first.call_count == 2
+
+
 def test_authenticate_user(db_session):
     hashed_password = get_password_hash("testpassword")
     db_session.query().filter().first.return_value = Client(
@@ -0,0 +1,62 @@
+import conftest
+import pytest
+from fastapi.testclient import TestClient
+import catalog
+import route.health as health
+from api import app
+from model_store import LoadedModel
+
+
+def test_live_and_ready(monkeypatch):
+    client = TestClient(app)
+    assert client.get("/health/live").json() == {"status": "alive"}
+
+    monkeypatch.setattr(health.MODEL_STORE, "current", None)
+    monkeypatch.setattr(catalog, "CATALOG", None)
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json() == {"ready": False, "model": None, "catalog": False}
+
+    monkeypatch.setattr(health.MODEL_STORE, "current", LoadedModel(object(), "v1", 0.))
+    monkeypatch.setattr(catalog, "CATALOG", catalog.CatalogIndex([(1, "a", "Action")]))
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json()["model"] == "v1"
+
+
+@pytest.mark.asyncio
+async def test_warm_up_retries(monkeypatch):
+    store = health.MODEL_STORE
+    monkeypatch.setattr(store, "current", None)
+    monkeypatch.setattr(catalog, "CATALOG", None)
+    attempts = []
+
+    def load():
+        attempts.append("model")
+        if len(attempts) == 1:
+            raise FileNotFoundError("no model yet")
+        store.current = LoadedModel(object(), "v1", 0.)
+        return True
+
+    async def load_catalog(db):
+        attempts.append("catalog")
+        if attempts.count("catalog") == 1:
+            raise OSError("database not reachable")
+        catalog.CATALOG = catalog.CatalogIndex([(1, "a", "Action")])
+
+    class Session:
+        async def __aenter__(self):
+            return None
+
+        async def __aexit__(self, *exc):
+            return False
+
+    monkeypatch.setattr(store, "load", load)
+    monkeypatch.setattr(store, "start", lambda: attempts.append("watch"))
+    monkeypatch.setattr(health, "load_catalog", load_catalog)
+    monkeypatch.setattr(health, "AsyncSessionLocal", Session)
+
+    await health.warm_up(retry_interval=0)
+    assert attempts == ["model", "model", "watch", "catalog", "catalog"]
+    assert health.readiness()["ready"]
+    assert health.READY_AT is not None
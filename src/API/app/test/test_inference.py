@@ -0,0 +1,64 @@
+import conftest
+import threading
+import numpy as np
+import pytest
+from prometheus_client import REGISTRY
+from inference import InferencePool
+from model_store import LoadedModel, ModelStore
+from test_model_store import write_artifact
+
+
+class ThreadModel:
+    """
+    Model recording the thread it is called from.
+    """
+
+    def kneighbors(self, X):
+        self.thread = threading.current_thread().name
+        return None, X * 2
+
+
+@pytest.mark.asyncio
+async def test_inline_before_start():
+    model = ThreadModel()
+    pool = InferencePool("thread", workers=1)
+    duration, indices = await pool.kneighbors(LoadedModel(model, "v1", 0.), np.ones((1, 2)))
+    assert indices.tolist() == [[2., 2.]]
+    assert model.thread == threading.current_thread().name
+
+
+@pytest.mark.asyncio
+async def test_thread_pool():
+    model = ThreadModel()
+    pool = InferencePool("thread", workers=1)
+    waits = REGISTRY.get_sample_value("recommendation_inference_wait_seconds_count")
+    pool.start()
+    try:
+        duration, indices = await pool.kneighbors(LoadedModel(model, "v1", 0.), np.ones((1, 2)))
+    finally:
+        pool.stop()
+    assert indices.tolist() == [[2., 2.]]
+    assert duration >= 0
+    assert model.thread.startswith("inference")
+    assert REGISTRY.get_sample_value("recommendation_inference_wait_seconds_count") - waits == 1
+    assert REGISTRY.get_sample_value("recommendation_inference_pending") == 0
+
+
+@pytest.mark.asyncio
+async def test_process_pool_loads_its_own_model(tmp_path):
+    write_artifact(tmp_path, "v1", np.eye(3))
+    store = ModelStore(tmp_path)
+    store.load()
+    X = np.array([[0., 1., 0.], [0., 0., 1.]])
+    pool = InferencePool("process", workers=1)
+    pool.start()
+    try:
+        _, indices = await pool.kneighbors(store.current, X)
+    finally:
+        pool.stop()
+    assert indices.tolist() == store.model.kneighbors(X)[1].tolist()
+
+
+def test_unknown_executor():
+    with pytest.raises(ValueError):
+        InferencePool("gpu")
@@ -4,6 +4,7 @@ from unittest.mock import MagicMock
 from fastapi import HTTPException
 from sqlalchemy.exc import IntegrityError
 from passlib.context import CryptContext
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
 from fastapi.security import OAuth2PasswordRequestForm
@@ -18,14 +19,16 @@ def db_session():
     """
     Simule une session de base de données pour les tests.
     """
-    return MagicMock()
+    session = MagicMock(spec=AsyncSession)
+    session.execute.return_value = MagicMock()
+    return session
 
 
 @pytest.mark.asyncio
 async def test_create_client(db_session):
     from route.manage_client import ClientCreate
 
-    db_session.query().filter().first.return_value = None
+    db_session.execute.return_value.scalars().first.return_value = None
     client_data = ClientCreate(username="testuser", name="Test User",
                                email="testuser@example.com", password="testpassword")
 
@@ -34,20 +37,20 @@ async def test_create_client(db_session):
     assert "client_id" in response
     db_session.add.assert_called_once()
 
-    db_session.commit.side_effect = MagicMock(spec=db_session.refresh, side_effect=IntegrityError(
-        statement=None, params=None, orig="some integrity error"))
+    db_session.commit.side_effect = IntegrityError(
+        statement=None, params=None, orig="some integrity error")
     with pytest.raises(HTTPException) as excinfo:
         await create_client(client=client_data, db=db_session)
     assert excinfo.value.status_code == 500
     assert excinfo.value.detail == "Error creating the client"
 
-    db_session.query().filter().first.side_effect = lambda: Client(username="testuser")
+    db_session.execute.return_value.scalars().first.side_effect = lambda: Client(username="testuser")
     with pytest.raises(HTTPException) as excinfo:
         await create_client(client=client_data, db=db_session)
     assert excinfo.value.status_code == 400
     assert excinfo.value.detail == "Client with this username already exists"
 
-    db_session.query().filter().first.side_effect = [
+    db_session.execute.return_value.scalars().first.side_effect = [
         None, Client(email="testuser@example.com")]
     with pytest.raises(HTTPException) as excinfo:
         await create_client(client=client_data, db=db_session)
@@ -59,7 +62,7 @@ async def test_create_client(db_session):
 async def test_login_for_access_token(db_session):
     from route.manage_client import Client
 
-    db_session.query().filter().first.return_value = Client(
+    db_session.execute.return_value.scalars().first.return_value = Client(
         username="testuser", hashed_password=pwd_context.hash("testpassword"))
 
     form_data = OAuth2PasswordRequestForm(
@@ -69,13 +72,13 @@ async def test_login_for_access_token(db_session):
     assert "access_token" in token
     assert token["token_type"] == "bearer"
 
-    db_session.query().filter().first.return_value = None
+    db_session.execute.return_value.scalars().first.return_value = None
     with pytest.raises(HTTPException) as excinfo:
         await login_for_access_token(form_data=form_data, db=db_session)
     assert excinfo.value.status_code == 400
     assert excinfo.value.detail == "Incorrect username or password"
 
-    db_session.query().filter().first.return_value = Client(
+    db_session.execute.return_value.scalars().first.return_value = Client(
         username="testuser", hashed_password=pwd_context.hash("wrongpassword"))
     with pytest.raises(HTTPException) as excinfo:
         await login_for_access_token(form_data=form_data, db=db_session)
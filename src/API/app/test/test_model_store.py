@@ -0,0 +1,159 @@
+import conftest
+import json
+import os
+import pickle
+import time
+import numpy as np
+import pytest
+from sklearn.neighbors import NearestNeighbors
+from model_store import ModelStore, MmapNeighbors
+
+
+def write_model(path, model, mtime):
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump(model, f)
+    os.replace(tmp_path, path)
+    os.utime(path, (mtime, mtime))
+
+
+def test_load_and_reload(tmp_path):
+    path = tmp_path / "model.pkl"
+    write_model(path, {"name": "v1"}, 1_700_000_000)
+    store = ModelStore(path)
+
+    assert store.load() is True
+    first = store.current
+    assert store.model == {"name": "v1"}
+    assert first.version == "20231114T221320"
+
+    # Unchanged file: nothing is reloaded
+    assert store.load() is False
+    assert store.current is first
+
+    write_model(path, {"name": "v2"}, 1_700_086_400)
+    assert store.load() is True
+    assert store.model == {"name": "v2"}
+    assert store.current.version == "20231115T221320"
+    # A request holding the previous version keeps it
+    assert first.model == {"name": "v1"}
+
+
+def test_failed_reload_keeps_previous_model(tmp_path):
+    path = tmp_path / "model.pkl"
+    write_model(path, {"name": "v1"}, 1_700_000_000)
+    store = ModelStore(path)
+    store.load()
+
+    path.write_bytes(b"not a pickle")
+    assert store.load() is False
+    assert store.model == {"name": "v1"}
+
+
+def test_first_load_failure_raises(tmp_path):
+    store = ModelStore(tmp_path / "missing.pkl")
+    with pytest.raises(FileNotFoundError):
+        store.load()
+
+
+def test_watcher_thread(tmp_path):
+    path = tmp_path / "model.pkl"
+    write_model(path, {"name": "v1"}, 1_700_000_000)
+    store = ModelStore(path, poll_interval=0.01)
+    store.load()
+    store.start()
+    try:
+        write_model(path, {"name": "v2"}, 1_700_086_400)
+        deadline = time.time() + 2
+        while store.model != {"name": "v2"} and time.time() < deadline:
+            time.sleep(0.01)
+        assert store.model == {"name": "v2"}
+    finally:
+        store.stop()
+
+
+def write_artifact(root, version, fit_X, n_neighbors=2):
+    artifact_dir = root / version
+    artifact_dir.mkdir()
+    np.save(artifact_dir / "fit_X.npy", fit_X)
+    np.save(artifact_dir / "fit_X_sq_norms.npy", (fit_X ** 2).sum(axis=1))
+    with open(artifact_dir / "metadata.json", "w") as f:
+        json.dump({"version": version, "n_neighbors": n_neighbors,
+                   "feature_names": ["a", "b", "c"]}, f)
+    (root / "LATEST").write_text(version)
+
+
+def test_mmap_neighbors_matches_sklearn(tmp_path):
+    rng = np.random.default_rng(0)
+    fit_X = rng.integers(0, 2, size=(200, 3)).astype(np.float64)
+    fit_X += rng.random((200, 3))
+    write_artifact(tmp_path, "v1", fit_X, n_neighbors=5)
+
+    model = MmapNeighbors(tmp_path / "v1")
+    assert isinstance(model.fit_X, np.memmap)
+    assert list(model.feature_names_in_) == ["a", "b", "c"]
+
+    X = rng.random((10, 3))
+    distances, indices = model.kneighbors(X)
+    expected_distances, expected_indices = NearestNeighbors(
+        n_neighbors=5, algorithm="ball_tree").fit(fit_X).kneighbors(X)
+    assert (indices == expected_indices).all()
+    assert np.allclose(distances, expected_distances)
+
+
+def test_load_artifact_from_latest(tmp_path):
+    write_model(tmp_path / "model.pkl", {"name": "pickle"}, 1_700_000_000)
+    store = ModelStore(tmp_path)
+    # No LATEST yet: falls back to model.pkl
+    store.load()
+    assert store.model == {"name": "pickle"}
+
+    write_artifact(tmp_path, "20240101T000000", np.eye(3))
+    assert store.load() is True
+    assert isinstance(store.model, MmapNeighbors)
+    assert store.current.version == "20240101T000000"
+    assert store.load() is False
+
+    assert store.model.popularity is None
+
+    # LATEST pointing to a broken artifact: the previous one keeps serving
+    (tmp_path / "LATEST").write_text("missing")
+    assert store.load() is False
+    assert store.current.version == "20240101T000000"
+
+
+def test_artifact_popularity_and_on_load(tmp_path):
+    write_artifact(tmp_path, "v1", np.eye(3))
+    artifact_dir = tmp_path / "v1"
+    with open(artifact_dir / "metadata.json") as f:
+        metadata = json.load(f)
+    metadata["popularity_genres"] = ["Comedy", "Drama"]
+    with open(artifact_dir / "metadata.json", "w") as f:
+        json.dump(metadata, f)
+    np.save(artifact_dir / "popularity_movie_ids.npy", np.array([2, 1, 4, 3], dtype=np.int32))
+    np.save(artifact_dir / "popularity_offsets.npy", np.array([0, 3, 4]))
+
+    loaded = []
+    store = ModelStore(tmp_path, on_load=loaded.append)
+    store.load()
+    assert loaded == [store.current]
+    assert store.model.popularity["Comedy"].tolist() == [2, 1, 4]
+    assert store.model.popularity["Drama"].tolist() == [3]
+
+
+def test_optional_pointer(tmp_path):
+    write_model(tmp_path / "model.pkl", {"name": "pickle"}, 1_700_000_000)
+    store = ModelStore(tmp_path, pointer="CANARY", role="canary", optional=True)
+    # No CANARY pointer: no model (model.pkl is for the primary model only)
+    assert store.load() is False
+    assert store.current is None
+
+    write_artifact(tmp_path, "20240101T000000", np.eye(3))
+    (tmp_path / "CANARY").write_text("20240101T000000")
+    assert store.load() is True
+    assert store.current.version == "20240101T000000"
+
+    # Rolled back: the canary stops serving
+    (tmp_path / "CANARY").unlink()
+    assert store.load() is True
+    assert store.current is None
@@ -0,0 +1,63 @@
+import conftest
+import asyncio
+import pytest
+from prometheus_client import REGISTRY
+from singleflight import SingleFlight
+
+
+def coalesced(name):
+    return REGISTRY.get_sample_value("api_coalesced_requests_total", {"name": name}) or 0
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_computation():
+    flight = SingleFlight("test_share")
+    calls = []
+
+    async def compute(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return {"value": value}
+
+    results = await asyncio.gather(*[flight.do("a", lambda: compute(1)) for _ in range(3)],
+                                   flight.do("b", lambda: compute(2)))
+    assert calls == [1, 2]
+    assert results == [{"value": 1}] * 3 + [{"value": 2}]
+    assert coalesced("test_share") == 2
+    assert len(flight) == 0
+
+    # Nothing is cached once the call is done
+    await flight.do("a", lambda: compute(1))
+    assert calls == [1, 2, 1]
+
+
+@pytest.mark.asyncio
+async def test_errors_are_shared():
+    flight = SingleFlight("test_errors")
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("database down")
+
+    results = await asyncio.gather(*[flight.do("a", fail) for _ in range(2)],
+                                   return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_first_call_is_taken_over():
+    flight = SingleFlight("test_cancel")
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    first = asyncio.create_task(flight.do("a", compute))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(flight.do("a", compute))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    assert await second == 2
+    assert first.cancelled()
@@ -0,0 +1,74 @@
+import conftest
+import json
+import numpy as np
+import pytest
+from model_store import MmapNeighbors
+from user_index import IVFUserIndex
+
+
+def write_user_index(path, user_ids, X, n_lists=20, n_probe=4, seed=0):
+    """
+    Writes the arrays of an IVF user index, as the train-model image does
+    (one k-means pass is enough for the tests).
+    """
+    X = X.astype(np.float32)
+    rng = np.random.default_rng(seed)
+    centroids = X[rng.choice(len(X), n_lists, replace=False)]
+    lists = ((X[:, None, :] - centroids[None]) ** 2).sum(axis=2).argmin(axis=1)
+    order = np.argsort(lists, kind="stable")
+    np.save(path / "users_ids.npy", np.asarray(user_ids, dtype=np.int32)[order])
+    np.save(path / "users_X.npy", X[order])
+    np.save(path / "ivf_centroids.npy", centroids)
+    np.save(path / "ivf_offsets.npy", np.searchsorted(lists[order], np.arange(n_lists + 1)))
+    return {"feature_names": [f"g{i}" for i in range(X.shape[1])],
+            "n_users": len(X), "n_lists": n_lists, "n_probe": n_probe}
+
+
+@pytest.fixture
+def users():
+    # Users around a few tastes, as genre vectors are
+    rng = np.random.default_rng(1)
+    tastes = rng.random((10, 5))
+    X = tastes[rng.integers(0, 10, size=2000)] + rng.normal(0, 0.05, size=(2000, 5))
+    return np.arange(2000) + 1, X
+
+
+def test_query_recall(tmp_path, users):
+    user_ids, X = users
+    index = IVFUserIndex(tmp_path, write_user_index(tmp_path, user_ids, X))
+    assert len(index) == 2000
+
+    recall = []
+    for x in X[:20] + 0.01:
+        distances = ((X - x) ** 2).sum(axis=1)
+        exact = set(user_ids[np.argsort(distances)[:10]])
+        found = index.query(x, 10)
+        assert len(found) == 10
+        # Closest first
+        found_distances = distances[np.asarray(found) - 1]
+        assert (np.diff(found_distances) >= 0).all()
+        recall.append(len(exact & set(found)) / 10)
+    assert np.mean(recall) > 0.9
+
+
+def test_query_excludes_user(tmp_path, users):
+    user_ids, X = users
+    index = IVFUserIndex(tmp_path, write_user_index(tmp_path, user_ids, X))
+    found = index.query(X[0], 5, exclude=int(user_ids[0]))
+    assert int(user_ids[0]) not in found and len(found) == 5
+
+    # Probing every list is an exact search
+    assert len(index.query(X[0], 1999, exclude=int(user_ids[0]), n_probe=20)) == 1999
+
+
+def test_artifact_user_index(tmp_path, users):
+    user_ids, X = users
+    params = write_user_index(tmp_path, user_ids, X)
+    np.save(tmp_path / "fit_X.npy", np.eye(3))
+    np.save(tmp_path / "fit_X_sq_norms.npy", np.ones(3))
+    with open(tmp_path / "metadata.json", "w") as f:
+        json.dump({"n_neighbors": 2, "feature_names": ["a", "b", "c"],
+                   "user_index": params}, f)
+    model = MmapNeighbors(tmp_path)
+    assert isinstance(model.user_index, IVFUserIndex)
+    assert model.user_index.feature_names == params["feature_names"]
@@ -0,0 +1,105 @@
+import conftest
+import asyncio
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import SQLAlchemyError
+from datamodel import MovieUserRating
+from metrics import WRITE_BEHIND_ROWS
+from write_behind import WriteBehindBuffer
+
+
+class FakeSession:
+    """
+    Async session recording the statements it executes.
+    """
+
+    def __init__(self, statements, fail=False):
+        self.statements = statements
+        self.fail = fail
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, stmt):
+        if self.fail:
+            raise SQLAlchemyError("connection lost")
+        self.statements.append(stmt)
+
+    async def commit(self):
+        pass
+
+
+def row(movie_id):
+    return {"userId": 1, "movieId": movie_id, "rating": None, "is_recommended": True}
+
+
+def n_rows(stmt):
+    params = stmt.compile(dialect=postgresql.dialect()).params
+    return sum(1 for name in params if name.startswith("movieId"))
+
+
+@pytest.mark.asyncio
+async def test_flush_by_size_and_on_stop():
+    statements = []
+    buffer = WriteBehindBuffer(MovieUserRating.__table__, lambda: FakeSession(statements),
+                               max_rows=3, flush_interval=10)
+    buffer.start()
+    await buffer.put([row(m) for m in range(4)])
+    # max_rows rows are queued: flushed without waiting flush_interval
+    for _ in range(100):
+        if statements:
+            break
+        await asyncio.sleep(0.01)
+    assert [n_rows(stmt) for stmt in statements] == [3]
+
+    sql = str(statements[0].compile(dialect=postgresql.dialect()))
+    assert sql.startswith("INSERT INTO movies_users_rating")
+    assert "ON CONFLICT DO NOTHING" in sql
+
+    await buffer.stop()
+    assert not buffer.running
+    assert [n_rows(stmt) for stmt in statements] == [3, 1]
+
+
+@pytest.mark.asyncio
+async def test_flush_by_interval():
+    statements = []
+    buffer = WriteBehindBuffer(MovieUserRating.__table__, lambda: FakeSession(statements),
+                               max_rows=100, flush_interval=0.01)
+    buffer.start()
+    await buffer.put([row(1)])
+    await asyncio.sleep(0.1)
+    assert len(statements) == 1
+    await buffer.stop()
+    assert len(statements) == 1
+
+
+@pytest.mark.asyncio
+async def test_backpressure():
+    statements = []
+    buffer = WriteBehindBuffer(MovieUserRating.__table__, lambda: FakeSession(statements),
+                               max_rows=2, flush_interval=10, maxsize=2)
+    buffer.start()
+    # The third row waits for the flusher to make room
+    await asyncio.wait_for(buffer.put([row(m) for m in range(3)]), 1)
+    await buffer.stop()
+    assert sum(n_rows(stmt) for stmt in statements) == 3
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_is_counted():
+    failures = WRITE_BEHIND_ROWS.labels(result="failure")
+    before = failures._value.get()
+    failed = []
+    buffer = WriteBehindBuffer(MovieUserRating.__table__, lambda: FakeSession([], fail=True),
+                               flush_interval=0.01,
+                               on_failure=lambda rows, error: failed.extend(rows))
+    buffer.start()
+    await buffer.put([row(1), row(2)])
+    await buffer.stop()
+    assert failures._value.get() - before == 2
+    # Handed over to the dead letter sink
+    assert failed == [row(1), row(2)]
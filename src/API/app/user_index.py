@@ -0,0 +1,72 @@
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+
+class IVFUserIndex:
+    """
+    Approximate nearest neighbour index over the users' genre vectors.
+
+    The index is built by the train-model image (k-means partitions, see
+    build_user_index there) and saved in the model artifact; its arrays are
+    memory-mapped. Users are stored list by list: a query ranks the
+    centroids, then only the users of the n_probe nearest lists, by exact
+    euclidean distance. A few thousand users are looked at, whatever the
+    number of users indexed.
+
+    Attributes:
+    - feature_names: Names of the features, in index order.
+    - n_probe: Number of lists probed by a query.
+    - user_ids: int32 array of the indexed users, in list order.
+    - X: float32 array of their genre vectors.
+    """
+
+    def __init__(self, path: Path, params: dict) -> None:
+        path = Path(path)
+        self.feature_names = params["feature_names"]
+        self.n_probe = params["n_probe"]
+        self.user_ids = np.load(path / "users_ids.npy", mmap_mode="r")
+        self.X = np.load(path / "users_X.npy", mmap_mode="r")
+        self.centroids = np.load(path / "ivf_centroids.npy")
+        self.offsets = np.load(path / "ivf_offsets.npy")
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def probe(self, x: np.ndarray, n_probe: int) -> np.ndarray:
+        """
+        Returns the indices of the n_probe lists nearest to x.
+        """
+        distances = ((self.centroids - x) ** 2).sum(axis=1)
+        if n_probe >= len(distances):
+            return np.arange(len(distances))
+        return np.argpartition(distances, n_probe)[:n_probe]
+
+    def query(self, x, k: int, exclude: Optional[int] = None,
+              n_probe: Optional[int] = None) -> List[int]:
+        """
+        Finds users similar to a genre vector.
+
+        Arguments:
+        - x: Genre vector, in feature_names order.
+        - k: Number of users to return.
+        - exclude: User ID to leave out (the querying user).
+        - n_probe: Lists to probe, defaults to the index's n_probe.
+
+        Returns:
+        - Up to k user IDs, closest first.
+        """
+        x = np.asarray(x, dtype=np.float32)
+        lists = self.probe(x, n_probe or self.n_probe)
+        slices = [slice(self.offsets[list_id], self.offsets[list_id + 1]) for list_id in lists]
+        X = np.concatenate([self.X[s] for s in slices])
+        user_ids = np.concatenate([self.user_ids[s] for s in slices])
+
+        distances = ((X - x) ** 2).sum(axis=1)
+        if len(distances) > k + 1:
+            nearest = np.argpartition(distances, k + 1)[:k + 1]
+        else:
+            nearest = np.arange(len(distances))
+        nearest = nearest[np.lexsort((user_ids[nearest], distances[nearest]))]
+        return [int(u) for u in user_ids[nearest] if u != exclude][:k]
@@ -0,0 +1,138 @@
+import asyncio
+import time
+import traceback
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import Table
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from metrics import WRITE_BEHIND_FLUSH_DURATION, WRITE_BEHIND_QUEUE_DEPTH, WRITE_BEHIND_ROWS
+
+# Queued after the last row by stop()
+_STOP = object()
+
+
+class WriteBehindBuffer:
+    """
+    Bounded in-process queue of rows inserted into a table in the
+    background.
+
+    Request handlers put rows and return without waiting for the database.
+    A background task flushes them with one multi-row
+    INSERT ... ON CONFLICT DO NOTHING and one commit, as soon as max_rows
+    rows are queued or flush_interval seconds after the first one. When
+    maxsize rows are waiting, put() waits for the flusher (backpressure).
+    stop() flushes the remaining rows. A failed flush is logged and counted,
+    its rows are passed to on_failure (or dropped).
+
+    Attributes:
+    - table: Table the rows are inserted into.
+    - session_factory: Callable returning a new AsyncSession.
+    - max_rows: Maximum number of rows of one INSERT.
+    - flush_interval: Maximum time a row waits in the queue, in seconds.
+    - maxsize: Maximum number of queued rows.
+    - on_failure: Optional callback, called with the rows of a failed flush
+      and the exception.
+    """
+
+    def __init__(self, table: Table, session_factory: Callable[[], AsyncSession],
+                 max_rows: int = 500, flush_interval: float = 0.05,
+                 maxsize: int = 10000,
+                 on_failure: Optional[Callable[[List[Dict], BaseException], None]] = None) -> None:
+        self.table = table
+        self.session_factory = session_factory
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.maxsize = maxsize
+        self.on_failure = on_failure
+        self._queue: Optional[asyncio.Queue] = None
+        self._full: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        """
+        True between start() and stop(): rows can be put.
+        """
+        return self._task is not None
+
+    def start(self) -> None:
+        """
+        Starts the flushing task on the running event loop.
+        """
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue(self.maxsize)
+        self._full = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="write-behind")
+
+    async def put(self, rows: List[Dict]) -> None:
+        """
+        Queues rows (dictionaries of column values), waiting while the queue
+        is full.
+        """
+        for row in rows:
+            await self._queue.put(row)
+        WRITE_BEHIND_QUEUE_DEPTH.set(self._queue.qsize())
+        if self._queue.qsize() >= self.max_rows:
+            self._full.set()
+
+    async def stop(self) -> None:
+        """
+        Flushes the queued rows and stops the flushing task.
+        """
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        await self._queue.put(_STOP)
+        self._full.set()
+        await task
+
+    async def _run(self) -> None:
+        while True:
+            first = await self._queue.get()
+            if first is _STOP:
+                return
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+
+            rows, stopping = [first], False
+            while len(rows) < self.max_rows and not self._queue.empty():
+                row = self._queue.get_nowait()
+                if row is _STOP:
+                    stopping = True
+                    break
+                rows.append(row)
+            WRITE_BEHIND_QUEUE_DEPTH.set(self._queue.qsize())
+            await self.flush(rows)
+            if stopping:
+                return
+
+    async def flush(self, rows: List[Dict]) -> bool:
+        """
+        Inserts rows in one statement and commits.
+
+        Returns:
+        - True if the rows were written, False if the flush failed.
+        """
+        start = time.perf_counter()
+        try:
+            async with self.session_factory() as db:
+                await db.execute(
+                    insert(self.table).values(rows).on_conflict_do_nothing())
+                await db.commit()
+        except Exception as e:
+            WRITE_BEHIND_ROWS.labels(result="failure").inc(len(rows))
+            print(f"Write-behind flush of {len(rows)} rows failed:",
+                  traceback.format_exc(limit=3))
+            if self.on_failure is not None:
+                self.on_failure(rows, e)
+            return False
+        finally:
+            WRITE_BEHIND_FLUSH_DURATION.observe(time.perf_counter() - start)
+        WRITE_BEHIND_ROWS.labels(result="success").inc(len(rows))
+        return True
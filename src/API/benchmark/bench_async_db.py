@@ -0,0 +1,76 @@
+"""
+Benchmark: blocking vs non-blocking database access in async handlers.
+
+Simulates N concurrent requests handled by one event loop (one uvicorn
+worker). Each request runs one query that takes QUERY_DELAY seconds on the
+server (pg_sleep), once through the synchronous Session (what the routes did
+before) and once through the AsyncSession.
+
+Needs the same environment variables as the API (DB_USER, DB_PASSWORD,
+DB_HOST, DB_PORT, DB_NAME) and a reachable PostgreSQL.
+
+Usage (from the root directory):
+    python src/API/benchmark/bench_async_db.py --requests 200 --concurrency 20
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+from sqlalchemy import text
+
+sys.path.append(str(Path(__file__).parent.parent / "app"))
+from db_manager import SessionLocal, AsyncSessionLocal, engine, async_engine  # noqa: E402
+
+QUERY = text("SELECT pg_sleep(:delay)")
+
+
+async def sync_handler(delay: float) -> None:
+    db = SessionLocal()
+    try:
+        db.execute(QUERY, {"delay": delay})
+    finally:
+        db.close()
+
+
+async def async_handler(delay: float) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(QUERY, {"delay": delay})
+
+
+async def run(handler, n_requests: int, concurrency: int, delay: float) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_request():
+        async with semaphore:
+            await handler(delay)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request() for _ in range(n_requests)))
+    return time.perf_counter() - start
+
+
+async def main(args) -> None:
+    # Warm both pools so connection setup is not measured
+    await run(sync_handler, args.concurrency, args.concurrency, 0)
+    await run(async_handler, args.concurrency, args.concurrency, 0)
+
+    for name, handler in [("sync Session", sync_handler),
+                          ("AsyncSession", async_handler)]:
+        elapsed = await run(handler, args.requests, args.concurrency, args.delay)
+        print(f"{name:>13}: {args.requests} requests in {elapsed:.2f}s "
+              f"-> {args.requests / elapsed:.1f} req/s")
+
+    engine.dispose()
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20,
+                        help="Concurrent requests, at most the pool size (20)")
+    parser.add_argument("--delay", type=float, default=0.01,
+                        help="Server-side duration of each query, in seconds")
+    asyncio.run(main(parser.parse_args()))
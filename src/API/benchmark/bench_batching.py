@@ -0,0 +1,99 @@
+"""
+Benchmark: throughput of the model calls with and without micro-batching.
+
+Runs many concurrent single-user rankings (rank_user_genres, the model
+call of POST /recommendations) on the event loop, with MODEL_BATCHER
+disabled (one kneighbors call per request) then enabled (concurrent rows
+coalesced into one call), and reports the rankings per second, the mean
+batch size and the wait added to each request. The model calls run on the
+inference executor given by --executor; the event loop lag (how late a
+1 ms timer fires, i.e. how long I/O-bound requests would be held) is
+reported too.
+
+Needs the same environment variables as the API (SECRET_API, DB_*) and a
+model in the models directory, but no database connection.
+
+Usage (from the root directory):
+    python src/API/benchmark/bench_batching.py --requests 5000 --concurrency 64 \
+        --executor thread
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent / "app"))
+from metrics import MODEL_BATCH_SIZE, MODEL_BATCH_WAIT  # noqa: E402
+from route.recommandation import (  # noqa: E402
+    GENRES, INFERENCE_POOL, MODEL_BATCHER, MODEL_STORE, rank_user_genres)
+
+
+def histogram(metric) -> tuple:
+    samples = {s.name: s.value for s in metric.collect()[0].samples}
+    return samples[metric._name + "_sum"], samples[metric._name + "_count"]
+
+
+async def run(X: np.ndarray, concurrency: int) -> tuple:
+    next_row = iter(range(len(X)))
+    lags, done = [], asyncio.Event()
+
+    async def client():
+        for i in next_row:
+            await rank_user_genres(X[i], i + 1)
+
+    async def ticker():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - start - 0.001)
+
+    ticking = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    done.set()
+    await ticking
+    return len(X) / elapsed, float(np.percentile(lags, 99))
+
+
+def main(args) -> None:
+    MODEL_STORE.load()
+    rng = np.random.default_rng(0)
+    X = rng.dirichlet(np.full(len(GENRES), 0.3), size=args.requests)
+    INFERENCE_POOL.kind, INFERENCE_POOL.workers = args.executor, args.workers
+    print(f"{args.requests} requests, concurrency {args.concurrency}, "
+          f"{args.executor} executor, model version {MODEL_STORE.current.version}")
+
+    throughput = {}
+    # Started once: the warm-up run loads the model in the worker processes
+    INFERENCE_POOL.start()
+    for name, max_rows in [("unbatched", 1), ("batched", args.batch_size)]:
+        MODEL_BATCHER.max_rows = max_rows
+        MODEL_BATCHER.max_wait = args.wait_us / 1e6
+        asyncio.run(run(X[:200], args.concurrency))
+        size_before, wait_before = histogram(MODEL_BATCH_SIZE), histogram(MODEL_BATCH_WAIT)
+        throughput[name], lag = asyncio.run(run(X, args.concurrency))
+        (rows, batches), (wait, waits) = [
+            (total - before[0], count - before[1]) for (total, count), before in
+            [(histogram(MODEL_BATCH_SIZE), size_before),
+             (histogram(MODEL_BATCH_WAIT), wait_before)]]
+        mean_wait = 1e6 * wait / waits if waits else 0.
+        print(f"{name:>10}: {throughput[name]:9.0f} rankings/s, "
+              f"mean batch {rows / batches:5.1f} rows, mean wait {mean_wait:6.1f} us, "
+              f"p99 loop lag {1e3 * lag:6.2f} ms")
+    INFERENCE_POOL.stop()
+    print(f"Throughput gain: x{throughput['batched'] / throughput['unbatched']:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--wait-us", type=float, default=500)
+    parser.add_argument("--executor", choices=["inline", "thread", "process"], default="thread")
+    parser.add_argument("--workers", type=int, default=4)
+    main(parser.parse_args())
@@ -0,0 +1,98 @@
+"""
+Benchmark: API cold start.
+
+Measures, in fresh processes:
+- the import time of api.py, and what startup used to cost before the
+  first request could be served (importing pandas and scikit-learn and
+  loading the model at import);
+- with uvicorn, the time from process start to the first 200 of
+  /health/live, to the model being loaded, and to /health/ready (model
+  and catalog loaded, which needs the database).
+
+Needs the same environment variables as the API (SECRET_API, DB_*) and a
+model in MODEL_PATH. Without a reachable database the API never gets
+ready: the time to the model being loaded is still reported.
+
+Usage (from the root directory):
+    python src/API/benchmark/bench_cold_start.py --runs 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+APP = Path(__file__).parent.parent / "app"
+
+LAZY = "import api"
+# What importing api.py did before the lazy startup
+EAGER = "import api, pandas, sklearn.neighbors; api.MODEL_STORE.load()"
+
+
+def import_time(code: str) -> float:
+    script = f"import time; t = time.perf_counter(); {code}; " \
+        "print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", script], cwd=APP, check=True,
+                         capture_output=True, text=True).stdout
+    return float(out.split()[-1])
+
+
+def get(url: str):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+    except (urllib.error.URLError, ConnectionError):
+        return None, None
+
+
+def time_to_ready(port: int, timeout: float) -> dict:
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--port", str(port)],
+        cwd=APP, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    times = {}
+    base = f"http://127.0.0.1:{port}"
+    try:
+        while time.perf_counter() - start < timeout and "ready" not in times:
+            if "live" not in times:
+                if get(base + "/health/live")[0] == 200:
+                    times["live"] = time.perf_counter() - start
+            else:
+                status, body = get(base + "/health/ready")
+                if body and body.get("model") and "model" not in times:
+                    times["model"] = time.perf_counter() - start
+                if status == 200:
+                    times["ready"] = time.perf_counter() - start
+            time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait()
+    return times
+
+
+def main(args) -> None:
+    for name, code in [("import api (lazy)", LAZY), ("import + model (eager)", EAGER)]:
+        times = [import_time(code) for _ in range(args.runs)]
+        print(f"{name:>24}: {statistics.median(times):.3f} s (median of {args.runs})")
+
+    runs = [time_to_ready(args.port, args.timeout) for _ in range(args.runs)]
+    for stage in ["live", "model", "ready"]:
+        times = [run[stage] for run in runs if stage in run]
+        if times:
+            print(f"{'time to ' + stage:>24}: {statistics.median(times):.3f} s")
+        else:
+            print(f"{'time to ' + stage:>24}: not reached in {args.timeout:.0f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=30.)
+    main(parser.parse_args())
@@ -0,0 +1,118 @@
+"""
+Benchmark: CPU time and allocations of the recommendation hot path, with
+and without pandas.
+
+Runs the in-process work of one POST /recommendations (everything but the
+database round trips) many times:
+- pandas: the user row as a one-row DataFrame, the genres ranked with
+  DataFrame/sort_values/sample, timestamps from pd.Timestamp (the code
+  before the pandas-free hot path, copied below);
+- numpy: features_vector, genre_order/sample_genres (the work of
+  rank_genres, run inline here) and now_seconds of the route.
+The model call is the same in both, its own cost is reported apart.
+
+Needs the same environment variables as the API (SECRET_API, DB_*) and a
+model in the models directory, but no database connection.
+
+Usage (from the root directory):
+    python src/API/benchmark/bench_hot_path.py --requests 2000
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent / "app"))
+from route.recommandation import (  # noqa: E402
+    GENRES, MODEL_STORE, features_vector, genre_order, now_seconds, sample_genres)
+
+
+def pandas_rank_genres(users: pd.DataFrame) -> pd.Series:
+    model = MODEL_STORE.model
+    _, indices = model.kneighbors(users[model.feature_names_in_])
+    movies_reco_vec = pd.DataFrame(
+        indices, columns=users.columns, index=users.index)
+
+    def rank(row):
+        ranked = list(row.sort_values(ascending=False).index)
+        chosen = row[ranked[:3]].sample().index[0]
+        return [chosen] + [genre for genre in ranked if genre != chosen]
+
+    return movies_reco_vec.apply(rank, axis=1)
+
+
+def pandas_request(row) -> list:
+    users = pd.DataFrame(
+        [[getattr(row, g) for g in GENRES]], columns=GENRES,
+        index=pd.Index([row.userId], name="userId"))
+    genres = pandas_rank_genres(users).loc[row.userId]
+    written_at = pd.Timestamp.now().round(freq='s').to_pydatetime()
+    saved_at = pd.Timestamp.now().round(freq='s')
+    return [genres, written_at, saved_at.to_pydatetime()]
+
+
+def numpy_request(row) -> list:
+    order = genre_order(MODEL_STORE.current, "primary",
+                        features_vector(row)[np.newaxis], GENRES)
+    genres = sample_genres(order, GENRES)[0]
+    return [genres, now_seconds(), now_seconds()]
+
+
+def model_only(row) -> list:
+    model = MODEL_STORE.model
+    return model.kneighbors(
+        np.array([[getattr(row, g) for g in model.feature_names_in_]]))
+
+
+def measure(request, rows) -> tuple:
+    for row in rows[:50]:
+        request(row)
+    # Best of 3 runs, the model call being noisy
+    cpu = float("inf")
+    for _ in range(3):
+        start = time.process_time()
+        for row in rows:
+            request(row)
+        cpu = min(cpu, (time.process_time() - start) / len(rows))
+
+    tracemalloc.start()
+    peaks = []
+    for row in rows[:200]:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        request(row)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+    return cpu, float(np.median(peaks))
+
+
+def main(args) -> None:
+    MODEL_STORE.load()
+    rng = np.random.default_rng(0)
+    X = rng.dirichlet(np.full(len(GENRES), 0.3), size=args.requests)
+    rows = [SimpleNamespace(userId=i + 1, **dict(zip(GENRES, x.tolist())))
+            for i, x in enumerate(X)]
+
+    print(f"{args.requests} requests, model version {MODEL_STORE.current.version}")
+    results = {}
+    for name, request in [("model call only", model_only),
+                          ("pandas", pandas_request),
+                          ("numpy", numpy_request)]:
+        cpu, peak = measure(request, rows)
+        results[name] = cpu
+        print(f"{name:>16}: {1e6 * cpu:8.1f} us CPU / request, "
+              f"peak allocation {peak / 1024:7.1f} KiB")
+    print(f"CPU per request outside the model call: "
+          f"{1e6 * max(results['pandas'] - results['model call only'], 0):.1f} us -> "
+          f"{1e6 * max(results['numpy'] - results['model call only'], 0):.1f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    main(parser.parse_args())
@@ -0,0 +1,78 @@
+"""
+Benchmark: event loop latency during a login storm.
+
+One event loop (one uvicorn worker) serves a stream of short "recommendation"
+requests (a coroutine that should resume every INTERVAL seconds) while
+LOGINS concurrent logins verify a bcrypt password, once inline (what
+login_for_access_token did before) and once through verify_password_async
+(bounded thread pool and login semaphore).
+
+The lateness of the recommendation coroutine is the latency added to every
+other request of the worker. Needs the same environment variables as the
+API (SECRET_API, DB_*), but no database connection.
+
+Usage (from the root directory):
+    python src/API/benchmark/bench_login_storm.py --logins 50
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "app"))
+from dependancies import verify_password, verify_password_async, get_password_hash  # noqa: E402
+
+INTERVAL = 0.005
+
+
+async def inline_login(password: str, hashed: str) -> None:
+    verify_password(password, hashed)
+
+
+async def pooled_login(password: str, hashed: str) -> None:
+    await verify_password_async(password, hashed)
+
+
+async def recommendations(stop: asyncio.Event, lateness: list) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(INTERVAL)
+        lateness.append(time.perf_counter() - start - INTERVAL)
+
+
+async def storm(login, n_logins: int, hashed: str) -> dict:
+    stop = asyncio.Event()
+    lateness = []
+    probe = asyncio.create_task(recommendations(stop, lateness))
+    await asyncio.sleep(0.05)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(login("password", hashed) for _ in range(n_logins)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await probe
+    lateness.sort()
+    return {
+        "logins/s": n_logins / elapsed,
+        "p50 ms": 1000 * statistics.median(lateness),
+        "p99 ms": 1000 * lateness[int(0.99 * (len(lateness) - 1))],
+        "max ms": 1000 * lateness[-1],
+    }
+
+
+async def main(args) -> None:
+    hashed = get_password_hash("password")
+    for name, login in [("inline bcrypt", inline_login),
+                        ("thread pool", pooled_login)]:
+        result = await storm(login, args.logins, hashed)
+        print(f"{name:>13}: " + ", ".join(
+            f"{key} {value:.1f}" for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--logins", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
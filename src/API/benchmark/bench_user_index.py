@@ -0,0 +1,94 @@
+"""
+Benchmark: IVF user index vs exact search over the users' genre vectors.
+
+Builds the index of the train-model image over N synthetic users, then
+compares query latency and recall@K with an exact NumPy search. A synthetic
+user has a taste (a sparse preference over genres) and rates a few dozen
+movies of data/external/movies.csv drawn according to it; its vector is the
+mean of their genre indicators, like the users table. No database is needed.
+
+Usage (from the root directory):
+    python src/API/benchmark/bench_user_index.py --users 300000
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+root = Path(__file__).parent.parent.parent
+sys.path.append(str(root / "API" / "app"))
+sys.path.append(str(root / "provider" / "images" / "train_model"))
+from user_index import IVFUserIndex  # noqa: E402
+from main import build_user_index  # noqa: E402
+
+MOVIES = root.parent / "data" / "external" / "movies.csv"
+
+
+def synthetic_users(n_users: int, rng, n_tastes: int = 1000, max_movies: int = 80) -> np.ndarray:
+    genres = pd.read_csv(MOVIES)["genres"].str.get_dummies(sep="|")\
+        .to_numpy(dtype=np.float32)
+    tastes = rng.dirichlet(np.full(genres.shape[1], 0.3), size=n_tastes)
+    user_tastes = rng.integers(0, n_tastes, size=n_users)
+    counts = rng.integers(5, max_movies, size=n_users)
+    X = np.empty((n_users, genres.shape[1]), dtype=np.float32)
+    for taste in range(n_tastes):
+        users = np.flatnonzero(user_tastes == taste)
+        weights = genres @ tastes[taste] + 1e-3
+        movies = rng.choice(len(genres), size=(len(users), max_movies),
+                            p=weights / weights.sum())
+        mask = np.arange(max_movies)[None, :] < counts[users, None]
+        X[users] = (genres[movies] * mask[..., None]).sum(axis=1) \
+            / counts[users, None]
+    return X
+
+
+def percentiles(times) -> str:
+    times = sorted(times)
+    return f"p50 {1000 * statistics.median(times):.3f} ms, " \
+        f"p99 {1000 * times[int(0.99 * (len(times) - 1))]:.3f} ms"
+
+
+def main(args) -> None:
+    rng = np.random.default_rng(0)
+    X = synthetic_users(args.users, rng)
+    user_ids = np.arange(len(X)) + 1
+    queries = X[rng.integers(0, len(X), size=args.queries)]
+
+    start = time.perf_counter()
+    params, arrays = build_user_index(
+        user_ids, X, [f"g{i}" for i in range(X.shape[1])], n_probe=args.probe)
+    print(f"build: {time.perf_counter() - start:.2f}s for {len(X)} users, "
+          f"{params['n_lists']} lists")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, array in arrays.items():
+            np.save(Path(tmp) / f"{name}.npy", array)
+        index = IVFUserIndex(tmp, params)
+
+        recall, ivf_times, exact_times = [], [], []
+        for x in queries:
+            start = time.perf_counter()
+            found = index.query(x, args.k)
+            ivf_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            expected = user_ids[np.argsort(((X - x) ** 2).sum(axis=1))[:args.k]]
+            exact_times.append(time.perf_counter() - start)
+            recall.append(len(set(found) & set(expected)) / args.k)
+
+    print(f"exact: {percentiles(exact_times)}")
+    print(f"  IVF: {percentiles(ivf_times)}")
+    print(f"recall@{args.k}: {np.mean(recall):.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--users", type=int, default=300000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--probe", type=int, default=8)
+    main(parser.parse_args())
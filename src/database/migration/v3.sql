@@ -0,0 +1,8 @@
+-- Users are ingested with explicit "userId" values, which does not advance
+-- the SERIAL sequence. Align it with the table so that the API can create
+-- users with INSERT ... RETURNING "userId".
+SELECT setval(
+  pg_get_serial_sequence('users', 'userId'),
+  COALESCE(MAX("userId"), 0) + 1,
+  false
+) FROM "users";
@@ -0,0 +1,12 @@
+-- The API updates the genre features of a user incrementally from
+-- count_movies (the number of movies the user rated). Backfill it for the
+-- users ingested before it was maintained.
+UPDATE "users" u
+SET "count_movies" = r.n
+FROM (
+  SELECT "userId", COUNT(*) AS n
+  FROM "movies_users_rating"
+  WHERE "rating" IS NOT NULL
+  GROUP BY "userId"
+) r
+WHERE u."userId" = r."userId";
@@ -77,3 +77,24 @@ def create_user_matrix(ratings, movies):
         "mean",
     )
     return user_matrix
+
+
+def count_user_movies(ratings, movies):
+    """
+    Counts the movies rated by each user, as used by create_user_matrix.
+
+    Parameters
+    -------
+    ratings : pd.DataFrame
+        DataFrame containing user ratings.
+    movies : pd.DataFrame
+        DataFrame containing information about the movies.
+
+    Returns
+    -------
+    pd.Series
+        Number of rated movies per userId. The API keeps the genre means of
+        the user matrix up to date incrementally from this count.
+    """
+    movie_ratings = ratings.merge(movies[["movieId"]], on="movieId", how="inner")
+    return movie_ratings.groupby("userId").size().rename("count_movies")
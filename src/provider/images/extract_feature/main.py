@@ -2,7 +2,7 @@
 import os
 from pathlib import Path
 import traceback
-from build_features import create_user_matrix, read_movies, read_ratings
+from build_features import create_user_matrix, count_user_movies, read_movies, read_ratings
 from datetime import datetime
 
 
@@ -24,6 +24,7 @@ def main():
         # TODO: Que faire s'il n'y a pas de movies.csv
         movies = read_movies("movies.csv", data_dir=data_raw)
         user_matrix = create_user_matrix(user_ratings, movies)
+        user_matrix["count_movies"] = count_user_movies(user_ratings, movies)
 
         os.makedirs(data_processed, exist_ok=True)
 
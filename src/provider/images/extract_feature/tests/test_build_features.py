@@ -2,7 +2,7 @@ import conftest
 import pytest
 import pandas as pd
 import os
-from build_features import read_ratings, read_movies, create_user_matrix
+from build_features import read_ratings, read_movies, create_user_matrix, count_user_movies
 
 TEST_DATA_DIR = "./src/provider/images/extract_feature/tests/data"
 
@@ -61,3 +61,11 @@ def test_create_user_matrix(ratings_df, movies_df, user_matrix_df):
 
     pd.testing.assert_frame_equal(result.reset_index(
         drop=True), user_matrix_df.reset_index(drop=True))
+
+
+def test_count_user_movies(ratings_df, movies_df):
+    result = count_user_movies(ratings_df, movies_df)
+
+    assert result.name == "count_movies"
+    assert result.sum() == len(ratings_df.merge(movies_df, on="movieId"))
+    assert list(result.index) == list(create_user_matrix(ratings_df, movies_df).index)
@@ -42,6 +42,7 @@ def main():
             'path_or_df': os.path.join(data_path, "processed",
                                        date.strftime(schema), 'user_matrix.csv'),
             'table_name': 'users',
+            'sync_sequence': 'userId',
             'schema': User
         },
         {
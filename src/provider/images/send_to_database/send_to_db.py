@@ -3,6 +3,7 @@ import pandas as pd
 import traceback
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy import text
 from typing import Union
 import os
 
@@ -20,6 +21,7 @@ class DataSender:
     - get_df(doc): Retrieves a DataFrame from a file path or an existing DataFrame.
     - send_df_to_database(values, Schema): Sends a row of data to the database using the provided schema.
     - keep_bad_data_df(df, name_df): Saves non-injected data in a CSV file for analysis.
+    - sync_sequence(Schema, column): Aligns a SERIAL sequence with the ingested IDs.
     - __call__(): Main method for ingesting files and sending the data to the database.
     """
 
@@ -137,6 +139,28 @@ class DataSender:
         except Exception as e:
             print(f"Error while saving bad data: {e}")
 
+    def sync_sequence(self, Schema, column: str) -> None:
+        """
+        Aligns the SERIAL sequence of a column with the rows just ingested.
+
+        Rows are ingested with explicit IDs, which does not advance the
+        sequence; the API relies on it to create new users.
+
+        Parameters:
+        - Schema: SQLAlchemy model of the table.
+        - column: Name of the SERIAL column.
+        """
+        table = Schema.__tablename__
+        try:
+            self.db.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+                f"COALESCE(MAX(\"{column}\"), 0) + 1, false) FROM \"{table}\""
+            ))
+            self.db.commit()
+        except SQLAlchemyError:
+            self.db.rollback()
+            print("SQLAlchemy error:", traceback.format_exc(limit=100))
+
     def change_type_col(df, col_types: dict):
         """
         Changes the column types according to the dict col_types in a pandas DataFrame.
@@ -167,6 +191,8 @@ class DataSender:
                 if list_bad_iter:
                     self.keep_bad_data_df(
                         df.iloc[list_bad_iter], doc["schema"].__tablename__)
+                if "sync_sequence" in doc:
+                    self.sync_sequence(doc["schema"], doc["sync_sequence"])
                 print("## Finished injection")
             except ValueError as ve:
                 print(f"Error in file {doc['path_or_df']}: {ve}")
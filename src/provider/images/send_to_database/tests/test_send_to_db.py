@@ -130,3 +130,27 @@ def test_call_process(mocker, mock_db_session):
     data_sender.get_df.assert_called_once()
     data_sender.send_df_to_database.assert_called()
     data_sender.keep_bad_data_df.assert_not_called()
+
+
+def test_sync_sequence(mocker, mock_db_session):
+    data_path = Path("test_data")
+    mock_df = pd.DataFrame({"userId": [1, 2]})
+
+    class MockUserSchema(MockSchema):
+        __tablename__ = "users"
+
+    mocker.patch.object(DataSender, 'get_df', return_value=mock_df)
+    mocker.patch.object(DataSender, 'send_df_to_database', return_value=True)
+
+    docs_links_tables = [{"path_or_df": "test_file.csv", "schema": MockUserSchema,
+                          "sync_sequence": "userId"}]
+
+    data_sender = DataSender(docs_links_tables=docs_links_tables,
+                             db_engine=mock_db_session, data_path=data_path)
+
+    data_sender()
+
+    mock_db_session.execute.assert_called_once()
+    query = str(mock_db_session.execute.call_args.args[0])
+    assert "pg_get_serial_sequence('users', 'userId')" in query
+    mock_db_session.commit.assert_called_once()
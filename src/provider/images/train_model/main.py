@@ -8,14 +8,27 @@ if "MAMBA_EXE" in os.environ:
 else:
     model_path = Path("/app/data/models")
 
-from datamodel import Movie
+from datamodel import Movie, MovieUserRating, User
+from sqlalchemy import func
 from sqlalchemy.exc import SQLAlchemyError
 from utils import get_db
 
+import json
+import shutil
+from datetime import datetime, timezone
+
+import numpy as np
 import pandas as pd
 from sklearn.neighbors import NearestNeighbors
 import pickle
 
+# Number of artifact versions kept in the models directory
+KEEP_VERSIONS = 5
+
+# Pointer files read by the API: LATEST is the primary model, CANARY and
+# SHADOW the optional models under evaluation
+POINTERS = ("LATEST", "CANARY", "SHADOW")
+
 
 def train_model(movie_matrix):
     nbrs = NearestNeighbors(n_neighbors=20, algorithm="ball_tree").fit(
@@ -24,6 +37,174 @@ def train_model(movie_matrix):
     return nbrs
 
 
+def popularity_lists(movies, stats):
+    """
+    Ranks the movies of each genre by popularity.
+
+    A movie belongs to the list of its first listed genre (the genre the API
+    recommends it for). Movies are ranked by number of ratings, then mean
+    rating, then movieId, so that the order is deterministic. Movies
+    without ratings are kept at the end.
+
+    Arguments:
+    - movies: DataFrame with movieId and genres (normalized, "|" separated).
+    - stats: DataFrame with movieId, n_ratings and mean_rating.
+
+    Returns:
+    - A tuple (genres, movie_ids, offsets) in CSR layout: the list of
+      genres[i] is movie_ids[offsets[i]:offsets[i + 1]].
+    """
+    df = movies[["movieId"]].assign(
+        genre=movies["genres"].fillna("").str.split("|").str[0])
+    df = df[df["genre"] != ""].merge(stats, on="movieId", how="left")
+    df["n_ratings"] = df["n_ratings"].fillna(0)
+    df["mean_rating"] = df["mean_rating"].fillna(0)
+    df = df.sort_values(["genre", "n_ratings", "mean_rating", "movieId"],
+                        ascending=[True, False, False, True])
+    counts = df.groupby("genre", sort=True).size()
+    offsets = np.concatenate([[0], np.cumsum(counts.to_numpy())])
+    return (list(counts.index), df["movieId"].to_numpy(dtype=np.int32),
+            offsets.astype(np.int64))
+
+
+def assign_lists(X, centroids, chunk=65536):
+    """
+    Returns the index of the nearest centroid of each row of X.
+    """
+    sq_norms = (centroids ** 2).sum(axis=1)
+    lists = np.empty(len(X), dtype=np.int64)
+    for i in range(0, len(X), chunk):
+        lists[i:i + chunk] = np.argmin(
+            sq_norms[None, :] - 2 * X[i:i + chunk] @ centroids.T, axis=1)
+    return lists
+
+
+def build_user_index(user_ids, X, feature_names, n_lists=None, n_probe=8,
+                     n_iter=10, sample_size=50000, seed=0):
+    """
+    Builds an IVF (inverted file) index over the users' genre vectors.
+
+    The vectors are partitioned by k-means (Lloyd iterations on a sample)
+    into n_lists lists. Users are stored sorted by list, so that list l is
+    the contiguous slice users_X[ivf_offsets[l]:ivf_offsets[l + 1]]. A query
+    only ranks the users of the n_probe lists whose centroids are nearest.
+
+    Arguments:
+    - user_ids: User identifiers (n_users).
+    - X: Genre vectors (n_users x n_features).
+    - feature_names: Names of the columns of X.
+    - n_lists: Number of lists, defaults to 2 * sqrt(n_users) (at most 1024).
+    - n_probe: Number of lists probed by a query.
+    - n_iter, sample_size, seed: k-means parameters.
+
+    Returns:
+    - A tuple (params, arrays): params go to metadata.json, arrays are
+      saved as <name>.npy.
+    """
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    user_ids = np.asarray(user_ids, dtype=np.int32)
+    rng = np.random.default_rng(seed)
+    sample = X[rng.choice(len(X), min(sample_size, len(X)), replace=False)]
+    if n_lists is None:
+        n_lists = min(1024, int(2 * np.sqrt(len(X))))
+    n_lists = max(1, min(n_lists, len(sample)))
+
+    if len(sample) == 0:
+        centroids = np.zeros((1, X.shape[1]), dtype=np.float32)
+    else:
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(n_iter if len(sample) else 0):
+        lists = assign_lists(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, lists, sample)
+        counts = np.bincount(lists, minlength=len(centroids))
+        centroids[counts > 0] = sums[counts > 0] / counts[counts > 0, None]
+
+    lists = assign_lists(X, centroids)
+    order = np.argsort(lists, kind="stable")
+    offsets = np.searchsorted(lists[order], np.arange(len(centroids) + 1))
+    params = {"feature_names": list(feature_names), "n_users": len(X),
+              "n_lists": len(centroids), "n_probe": n_probe}
+    arrays = {
+        "users_ids": user_ids[order],
+        "users_X": X[order],
+        "ivf_centroids": centroids,
+        "ivf_offsets": offsets.astype(np.int64),
+    }
+    return params, arrays
+
+
+def write_artifact(model, root, version=None, popularity=None, user_index=None,
+                   pointer="LATEST"):
+    """
+    Writes the fitted model as a versioned artifact the API memory-maps.
+
+    root/<version>/ holds raw NumPy arrays (the fitted data and the squared
+    norms of its rows) and metadata.json. root/<pointer> is then replaced
+    atomically with the version name, and only the KEEP_VERSIONS most recent
+    versions are kept, plus the ones a pointer still refers to.
+
+    Arguments:
+    - model: Fitted NearestNeighbors (on a DataFrame, for the feature names).
+    - root: Models directory.
+    - version: Version name, defaults to the current UTC time.
+    - popularity: Optional popularity_lists() result, saved as
+      popularity_movie_ids.npy and popularity_offsets.npy.
+    - user_index: Optional build_user_index() result.
+    - pointer: Pointer file to publish the version to (see POINTERS).
+
+    Returns:
+    - Path of the artifact directory.
+    """
+    root = Path(root)
+    version = version or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    fit_X = np.ascontiguousarray(model._fit_X, dtype=np.float64)
+    metadata = {
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "feature_names": [str(name) for name in model.feature_names_in_],
+        "n_neighbors": model.n_neighbors,
+        "metric": "euclidean",
+        "n_samples": fit_X.shape[0],
+    }
+    if popularity is not None:
+        metadata["popularity_genres"] = popularity[0]
+    if user_index is not None:
+        metadata["user_index"] = user_index[0]
+
+    # Written in a temporary directory then renamed: LATEST only ever
+    # points to complete artifacts
+    tmp_dir = root / f".{version}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    np.save(tmp_dir / "fit_X.npy", fit_X)
+    np.save(tmp_dir / "fit_X_sq_norms.npy", np.einsum("ij,ij->i", fit_X, fit_X))
+    if popularity is not None:
+        np.save(tmp_dir / "popularity_movie_ids.npy", popularity[1])
+        np.save(tmp_dir / "popularity_offsets.npy", popularity[2])
+    if user_index is not None:
+        for name, array in user_index[1].items():
+            np.save(tmp_dir / f"{name}.npy", array)
+    with open(tmp_dir / "metadata.json", "w") as f:
+        json.dump(metadata, f, indent=2)
+    artifact_dir = root / version
+    shutil.rmtree(artifact_dir, ignore_errors=True)
+    os.replace(tmp_dir, artifact_dir)
+
+    pointer_tmp = root / f"{pointer}.tmp"
+    pointer_tmp.write_text(version)
+    os.replace(pointer_tmp, root / pointer)
+
+    published = {(root / name).read_text().strip() for name in POINTERS
+                 if (root / name).is_file()}
+    versions = sorted(p for p in root.iterdir()
+                      if p.is_dir() and (p / "metadata.json").is_file())
+    for old in versions[:-KEEP_VERSIONS]:
+        if old.name not in published:
+            shutil.rmtree(old, ignore_errors=True)
+    return artifact_dir
+
+
 def main():
     db = get_db()
     try:
@@ -36,8 +217,35 @@ def main():
         genres = df["genres"].str.get_dummies(sep="|")
         result_df = pd.concat([df[["movieId"]], genres], axis=1)
         model = train_model(result_df)
-        with open(os.path.join(model_path, "model.pkl"), "wb") as f:
-            pickle.dump(model, f)
+        # LATEST (default), or CANARY / SHADOW to evaluate the new model
+        # before promoting it
+        pointer = os.environ.get("PUBLISH_AS", "LATEST")
+        if pointer == "LATEST":
+            # Write then rename, so that the API never reads a partial file
+            tmp_path = os.path.join(model_path, "model.pkl.tmp")
+            with open(tmp_path, "wb") as f:
+                pickle.dump(model, f)
+            os.replace(tmp_path, os.path.join(model_path, "model.pkl"))
+
+        stats = pd.DataFrame(
+            db.query(MovieUserRating.movieId,
+                     func.count(MovieUserRating.rating),
+                     func.avg(MovieUserRating.rating))
+            .filter(MovieUserRating.rating.is_not(None))
+            .group_by(MovieUserRating.movieId).all(),
+            columns=["movieId", "n_ratings", "mean_rating"])
+
+        features = [column.name for column in User.__table__.columns
+                    if column.name not in ("userId", "count_movies")]
+        users = pd.DataFrame(
+            db.query(User.userId, *[getattr(User, f) for f in features]).all(),
+            columns=["userId"] + features).fillna(0)
+        user_index = build_user_index(
+            users["userId"], users[features].to_numpy(), features)
+
+        write_artifact(model, model_path,
+                       popularity=popularity_lists(df, stats),
+                       user_index=user_index, pointer=pointer)
 
     except SQLAlchemyError:
         db.rollback()
@@ -1,6 +1,8 @@
 # import conftest
 import pytest
 from unittest import mock
+import json
+import numpy as np
 import pandas as pd
 from sklearn.neighbors import NearestNeighbors
 from unittest.mock import patch
@@ -31,3 +33,95 @@ def test_train_model():
     from main import train_model
     model = train_model(movie_matrix)
     assert isinstance(model, NearestNeighbors)
+
+
+def test_write_artifact(tmp_path):
+    movie_matrix = pd.DataFrame({
+        "movieId": [1, 2, 3],
+        "genre1": [1, 0, 1],
+        "genre2": [0, 1, 0]
+    })
+    from main import train_model, write_artifact, KEEP_VERSIONS
+    model = train_model(movie_matrix)
+
+    for i in range(KEEP_VERSIONS + 1):
+        artifact_dir = write_artifact(model, tmp_path, f"2024010{i}T000000")
+
+    assert (tmp_path / "LATEST").read_text() == artifact_dir.name
+    with open(artifact_dir / "metadata.json") as f:
+        metadata = json.load(f)
+    assert metadata["feature_names"] == ["genre1", "genre2"]
+    assert metadata["n_neighbors"] == 20
+    fit_X = np.load(artifact_dir / "fit_X.npy", mmap_mode="r")
+    assert fit_X.tolist() == [[1, 0], [0, 1], [1, 0]]
+    assert np.load(artifact_dir / "fit_X_sq_norms.npy").tolist() == [1, 1, 1]
+    # Older versions are pruned
+    assert not (tmp_path / "20240100T000000").exists()
+    assert len([p for p in tmp_path.iterdir() if p.is_dir()]) == KEEP_VERSIONS
+
+
+def test_write_artifact_canary(tmp_path):
+    movie_matrix = pd.DataFrame({
+        "movieId": [1, 2, 3],
+        "genre1": [1, 0, 1],
+        "genre2": [0, 1, 0]
+    })
+    from main import train_model, write_artifact, KEEP_VERSIONS
+    model = train_model(movie_matrix)
+
+    write_artifact(model, tmp_path, "20240100T000000", pointer="CANARY")
+    for i in range(1, KEEP_VERSIONS + 2):
+        write_artifact(model, tmp_path, f"2024010{i}T000000")
+
+    assert (tmp_path / "CANARY").read_text() == "20240100T000000"
+    assert (tmp_path / "LATEST").read_text() == f"2024010{KEEP_VERSIONS + 1}T000000"
+    # The canary version is kept while CANARY points to it
+    assert (tmp_path / "20240100T000000").exists()
+    assert not (tmp_path / "20240101T000000").exists()
+
+
+def test_popularity_lists(tmp_path):
+    movies = pd.DataFrame({
+        "movieId": [1, 2, 3, 4, 5],
+        "genres": ["Comedy|Drama", "Comedy", "Drama", "Comedy", ""]
+    })
+    stats = pd.DataFrame({
+        "movieId": [1, 2, 3],
+        "n_ratings": [10, 10, 3],
+        "mean_rating": [3.5, 4.0, 5.0]
+    })
+    from main import popularity_lists, train_model, write_artifact
+    genres, movie_ids, offsets = popularity_lists(movies, stats)
+    assert genres == ["Comedy", "Drama"]
+    # Same count: best mean first, unrated movies last
+    assert movie_ids.tolist() == [2, 1, 4, 3]
+    assert offsets.tolist() == [0, 3, 4]
+
+    model = train_model(pd.DataFrame({"movieId": [1], "genre1": [1]}))
+    artifact_dir = write_artifact(model, tmp_path, "v1",
+                                  popularity=(genres, movie_ids, offsets))
+    with open(artifact_dir / "metadata.json") as f:
+        assert json.load(f)["popularity_genres"] == ["Comedy", "Drama"]
+    assert np.load(artifact_dir / "popularity_movie_ids.npy").tolist() == [2, 1, 4, 3]
+
+
+def test_build_user_index():
+    from main import build_user_index
+    rng = np.random.default_rng(0)
+    X = rng.random((500, 4))
+    params, arrays = build_user_index(np.arange(500) + 1, X, list("abcd"),
+                                      n_lists=10, n_probe=2)
+    assert params == {"feature_names": ["a", "b", "c", "d"], "n_users": 500,
+                      "n_lists": 10, "n_probe": 2}
+    offsets, centroids = arrays["ivf_offsets"], arrays["ivf_centroids"]
+    assert offsets.tolist()[0] == 0 and offsets.tolist()[-1] == 500
+    assert sorted(arrays["users_ids"].tolist()) == list(range(1, 501))
+    # Users are stored list by list, each one in the list of its nearest centroid
+    for l in range(10):
+        users = arrays["users_X"][offsets[l]:offsets[l + 1]]
+        nearest = ((users[:, None, :] - centroids[None]) ** 2).sum(axis=2).argmin(axis=1)
+        assert (nearest == l).all()
+
+    # Empty users table
+    params, arrays = build_user_index([], np.zeros((0, 4)), list("abcd"))
+    assert arrays["ivf_offsets"].tolist() == [0, 0]